@@ -1,14 +1,24 @@
 import os
+import sys
+import time
+import signal
 import asyncio
-import warnings
 import logging
-import sqlite3
 from itertools import cycle
 
 import discord
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
-import mafic
+
+from backend_gate import load_backend_gate
+from cog_loader import LazyCogs, command_tree_hash, load_extensions, plan_cogs
+from conversation_buffer import load_conversation_buffer
+from database import Database
+from http_client import HttpClient
+from intents_profile import build_client_options, load_memory_baselines, memory_report, record_memory_baseline
+from message_router import MessageRouter
+from metrics import MetricsRegistry
+from sharding import ShardConfig, run_cluster_launcher
 
 # ---------- Logging (SEE CONSOLE) ----------
 logging.basicConfig(
@@ -20,15 +30,11 @@ logging.getLogger("mafic").setLevel(logging.DEBUG)     # <— noisy but useful
 logging.getLogger("websockets").setLevel(logging.WARNING)
 log = logging.getLogger("arisu")
 
-# ---------- Mafic version warning (name differs across versions) ----------
-try:
-    from mafic.pool import UnsupportedVersionWarning as MaficVersionWarning
-except Exception:
-    try:
-        from mafic.pool import UnknownVersionWarning as MaficVersionWarning
-    except Exception:
-        MaficVersionWarning = Warning
-warnings.filterwarnings("ignore", category=MaficVersionWarning)
+# ---------- Startup timings ----------
+startup_started = time.perf_counter()
+
+def log_startup_phase(phase: str, started: float):
+    log.info("Startup phase %s took %.0f ms", phase, (time.perf_counter() - started) * 1000)
 
 # ---------- Env / Token ----------
 load_dotenv(override=True)
@@ -41,9 +47,39 @@ elif TOKEN.strip() != TOKEN:
 else:
     print("Bot token is valid.")
 
-# ---------- Bot / Intents ----------
-intents = discord.Intents.all()
-client = commands.Bot(command_prefix="!", intents=intents)
+# ---------- Bot / Intents / Shards ----------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COGS_DIR = os.path.join(BASE_DIR, "cogs")
+COMMAND_PREFIX = "!"
+
+# BOT_INTENTS_PROFILE=minimal builds intents from each cog's REQUIRED_INTENTS (see intents_profile.py)
+client_options = build_client_options(COGS_DIR)
+shard_config = ShardConfig.from_env()
+client = shard_config.bot_class()(command_prefix=COMMAND_PREFIX, **client_options, **shard_config.bot_kwargs())
+client.shard_config = shard_config
+
+# Cheap gate in front of on_message (see message_router.py)
+message_router = MessageRouter(COMMAND_PREFIX)
+client.zero_two = None   # set by cogs/zerotwo.py while it is loaded, saves a get_cog per mention
+
+# ---------- Database (shared by every cog, see database.py) ----------
+client.db = Database()
+
+# ---------- Metrics (served by cogs/monitoring.py; cogs add their own histograms) ----------
+client.metrics = MetricsRegistry()
+client.metrics.add_histogram(client.db.query_seconds)
+
+# ---------- HTTP (one pooled session for n8n / LangGraph, see http_client.py) ----------
+client.http_client = HttpClient()
+
+# Recent messages per channel for ZeroTwo / LangGraph payloads (filled by cogs/conversation.py)
+client.conversations = load_conversation_buffer()
+
+# Concurrency gates per backend (see backend_gate.py); callers over the limit get a fast "busy" reply
+client.backend_gates = {
+    "langgraph": load_backend_gate("langgraph", max_concurrency=4),
+    "n8n": load_backend_gate("n8n", max_concurrency=8),
+}
 
 # ---------- Presence ----------
 # client_statuses = cycle(["I am the tester?...", "master needs my help."])
@@ -57,18 +93,7 @@ async def change_client_status():
         pass
 
 # ---------- Lavalink (Mafic) ----------
-async def ensure_lavalink_node():
-    if not hasattr(client, "lavalink"):
-        client.lavalink = mafic.NodePool(client)
-    # Your remote node (we already opened 2333)
-    await client.lavalink.create_node(
-        host="127.0.0.1",
-        port=2333,
-        password="zerotwo",
-        label="MAIN",
-        # secure=False  # default
-    )
-    log.info("Connected Lavalink node MAIN at 10.22.22.135:2333")
+# Nodes are created by the music cog (see lavalink_nodes.ensure_lavalink_nodes)
 
 # Forward Discord VOICE_* gateway events to Mafic
 @client.event
@@ -80,16 +105,43 @@ async def on_socket_response(payload):
 @client.event
 async def on_ready():
     log.info("Bot is ready")
-    change_client_status.start()
-    await ensure_lavalink_node()
+    if not change_client_status.is_running():
+        change_client_status.start()
+    if not getattr(client, "tree_synced", False):
+        log_startup_phase("total (to first ready)", startup_started)
+        started = time.perf_counter()
+        await sync_command_tree()
+        log_startup_phase("slash sync", started)
+    if getattr(client, "memory_baseline", None) is None:
+        try:
+            await record_memory_baseline(client, client.db)
+        except Exception as e:
+            log.exception("Could not record the memory baseline: %s", e)
+
+async def sync_command_tree():
+    """Sync slash commands once per process, and only when their definitions changed."""
     try:
-        synced = await client.tree.sync()
-        log.info("Synced %d commands.", len(synced))
+        digest = command_tree_hash(client)
+        row = await client.db.fetchone("SELECT value FROM Bot_State WHERE key = ?", ("command_tree_hash",))
+        if row and row[0] == digest:
+            log.info("Slash commands unchanged, skipping sync.")
+        else:
+            synced = await client.tree.sync()
+            log.info("Synced %d commands.", len(synced))
+            await client.db.execute(
+                "INSERT OR REPLACE INTO Bot_State (key, value) VALUES (?, ?)", ("command_tree_hash", digest)
+            )
+        client.tree_synced = True
     except Exception as e:
         log.exception("Slash sync failed: %s", e)
 
 @client.event
 async def on_command_error(ctx, error):
+    # First use of a command from a lazy cog: load the cog, then run the command for real
+    if isinstance(error, commands.CommandNotFound) and await lazy_cogs.load_for(client, ctx.invoked_with):
+        await client.invoke(await client.get_context(ctx.message))
+        return
+
     # Surface command errors to console and chat
     log.exception("Command error in %s: %s", ctx.command, error)
     try:
@@ -102,30 +154,27 @@ async def on_message(message: discord.Message):
     if message.author.bot:
         return
 
+    # Chatter (no "!" prefix, no mention of the bot) stops here, before any context is built
+    if message_router.bot_id is None:
+        if client.user is None:
+            return
+        message_router.bind(client.user.id)
+    prompt = message_router.route(message)
+    if prompt is None:
+        return
+
+    # One context for both the Zero Two trigger and command dispatch
+    ctx = await client.get_context(message)
+
     # Mention-based trigger for Zero Two (no prefix required)
-    if client.user and message.mentions and client.user in message.mentions:
-        content = message.content
-        bot_id = client.user.id
-        content = content.replace(f"<@{bot_id}>", "").replace(f"<@!{bot_id}>", "").strip()
-
-        # Optional friendly prefix cleanup: "| Zero Two's proxy"
-        if content.startswith("|"):
-            content = content[1:].lstrip()
-        lowered = content.lower()
-        if lowered.startswith("zero two's proxy"):
-            content = content[len("zero two's proxy"):].lstrip(" -:|\t")
-
-        if content:
-            zero_two = client.get_cog("ZeroTwoCog")
-            if zero_two:
-                ctx = await client.get_context(message)
-                try:
-                    async with message.channel.typing():
-                        await zero_two.ask_zero_two(ctx, message=content)
-                except Exception as e:
-                    log.exception("ZeroTwo mention trigger failed: %s", e)
+    if prompt and client.zero_two is not None:
+        try:
+            async with message.channel.typing():
+                await client.zero_two.ask_zero_two(ctx, message=prompt)
+        except Exception as e:
+            log.exception("ZeroTwo mention trigger failed: %s", e)
 
-    await client.process_commands(message)
+    await client.invoke(ctx)
 
 # quick sanity text & slash
 @client.command()
@@ -136,49 +185,82 @@ async def hello(ctx: commands.Context):
 async def hello_slash(interaction: discord.Interaction):
     await interaction.response.send_message(f"{interaction.user.mention} Hello!", ephemeral=True)
 
+@client.command(name="httpstats")
+@commands.is_owner()
+async def httpstats(ctx: commands.Context):
+    gates = "\n".join(f"{name}: {gate.snapshot()}" for name, gate in client.backend_gates.items())
+    outbox = f"\n\nvoice-state outbox: {client.zero_two.voice_outbox.summary()}" if client.zero_two else ""
+    await ctx.send(f"```\n{client.http_client.summary()}\n\n{gates}{outbox}\n```")
+
+@client.command(name="memory")
+@commands.is_owner()
+async def memory(ctx: commands.Context):
+    baselines = await load_memory_baselines(client.db)
+    await ctx.send(f"```yaml\n{memory_report(client, baselines=baselines)}\n```")
+
 # ---------- SQLite (fixed DELETE syntax) ----------
 @client.event
 async def on_guild_join(guild: discord.Guild):
-    os.makedirs("servers_info", exist_ok=True)
-    conn = sqlite3.connect("servers_info/main.db")
-    cur = conn.cursor()
-    cur.execute("CREATE TABLE IF NOT EXISTS Guilds (guild_id INTEGER PRIMARY KEY)")
-    cur.execute("INSERT OR IGNORE INTO Guilds (guild_id) VALUES (?)", (guild.id,))
-    conn.commit()
-    conn.close()
+    await client.db.execute("INSERT OR IGNORE INTO Guilds (guild_id) VALUES (?)", (guild.id,))
 
 @client.event
 async def on_guild_remove(guild: discord.Guild):
-    conn = sqlite3.connect("servers_info/main.db")
-    cur = conn.cursor()
-    cur.execute("DELETE FROM Guilds WHERE guild_id = ?", (guild.id,))
-    conn.commit()
-    conn.close()
+    await client.db.execute("DELETE FROM Guilds WHERE guild_id = ?", (guild.id,))
 
 # ---------- Auto-load cogs ----------
+# BOT_COGS_ENABLED / BOT_COGS_DISABLED / BOT_COGS_LAZY, see cog_loader.py
+cog_plan = plan_cogs(COGS_DIR)
+lazy_cogs = LazyCogs(cog_plan)
+
 async def load_cogs():
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    cogs_dir = os.path.join(base_dir, "cogs")
-    os.makedirs(cogs_dir, exist_ok=True)
+    log.info("Loading cogs from %s", COGS_DIR)
+    for extension in cog_plan.disabled:
+        log.info("Skipping disabled cog: %s", extension)
+    if cog_plan.lazy:
+        log.info("Lazy cog commands: %s", ", ".join(sorted(cog_plan.lazy)))
+    await load_extensions(client, cog_plan.eager)
 
-    log.info("Loading cogs from %s", cogs_dir)
-    for filename in sorted(os.listdir(cogs_dir)):
-        if not filename.endswith(".py"):
-            continue
+def install_shutdown_handlers():
+    """Close the client on SIGTERM/SIGINT so main()'s cleanup (cog unload, final music positions) runs."""
+    loop = asyncio.get_running_loop()
 
-        extension = f"cogs.{filename[:-3]}"
+    def _shutdown(signame):
+        log.info("Received %s, shutting down", signame)
+        if not client.is_closed():
+            asyncio.create_task(client.close())
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
         try:
-            await client.load_extension(extension)
-            log.info("Loaded cog: %s", extension)
-        except Exception as e:
-            log.exception("Failed to load cog %s: %s", extension, e)
+            loop.add_signal_handler(sig, _shutdown, sig.name)
+        except (NotImplementedError, RuntimeError):
+            # Windows: no loop signal handlers; Ctrl+C still cancels main() and runs its cleanup
+            pass
 
 async def main():
+    log.info("Gateway: %s", shard_config.describe())
+    install_shutdown_handlers()
     async with client:
-        await load_cogs()
-        await client.start(TOKEN)
+        started = time.perf_counter()
+        await client.db.connect()
+        log_startup_phase("database", started)
+        try:
+            started = time.perf_counter()
+            await load_cogs()
+            log_startup_phase("cogs", started)
+            await client.start(TOKEN)
+        finally:
+            # Let cogs save their state (e.g. music positions) while the database is still open
+            for extension in list(client.extensions):
+                try:
+                    await client.unload_extension(extension)
+                except Exception as e:
+                    log.exception("Failed to unload cog %s: %s", extension, e)
+            await client.http_client.close()
+            await client.db.close()
 
 if __name__ == "__main__":
+    if shard_config.is_launcher:
+        sys.exit(run_cluster_launcher(shard_config, os.path.abspath(__file__)))
     asyncio.run(main())
 
 
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, TypeVar
+
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class BackendBusy(Exception):
+    """Raised when a backend gate sheds a request instead of queueing it."""
+
+    def __init__(self, backend: str, reason: str):
+        super().__init__(f"{backend} is busy ({reason})")
+        self.backend = backend
+        self.reason = reason
+
+
+class BackendGate:
+    """Bounded concurrency for one backend, with a fair per-user wait queue.
+
+    At most ``max_concurrency`` requests run at once. Waiting callers are served
+    round-robin by user, so one user spamming a command cannot starve everyone
+    else. Callers are shed with ``BackendBusy`` when the queue is full, when they
+    already have ``max_pending_per_user`` requests waiting, or after waiting
+    ``queue_timeout`` seconds. Requests with the same key that are in flight at
+    the same time share one backend call.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 4,
+        max_queue: int = 50,
+        max_pending_per_user: int = 2,
+        queue_timeout: float = 10.0,
+    ):
+        self.name = name
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self.max_pending_per_user = max(int(max_pending_per_user), 1)
+        self.queue_timeout = float(queue_timeout)
+
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self.coalesced = 0
+        self._waiters: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def _acquire(self, user_id: Hashable) -> None:
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            return
+
+        user_queue = self._waiters.get(user_id)
+        if self.waiting >= self.max_queue:
+            self.shed += 1
+            raise BackendBusy(self.name, "queue full")
+        if user_queue is not None and len(user_queue) >= self.max_pending_per_user:
+            self.shed += 1
+            raise BackendBusy(self.name, "too many pending requests")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user_id, deque()).append(waiter)
+        self.waiting += 1
+
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot reached us just as we were cancelled; pass it on
+                self._release()
+            raise
+        finally:
+            if not waiter.done():
+                # Timed out or cancelled while still queued: give up our place
+                waiter.cancel()
+                self._discard_waiter(user_id, waiter)
+
+        if waiter.cancelled():
+            self.shed += 1
+            raise BackendBusy(self.name, "queue timeout")
+        # _release() handed its slot over to us; self.active already counts it
+
+    def _discard_waiter(self, user_id: Hashable, waiter: asyncio.Future) -> None:
+        user_queue = self._waiters.get(user_id)
+        if user_queue is None:
+            return
+        try:
+            user_queue.remove(waiter)
+        except ValueError:
+            return
+        self.waiting -= 1
+        if not user_queue:
+            del self._waiters[user_id]
+
+    def _release(self) -> None:
+        while self._waiters:
+            user_id, user_queue = next(iter(self._waiters.items()))
+            waiter = user_queue.popleft()
+            self.waiting -= 1
+            if user_queue:
+                # Round-robin: this user goes to the back of the line
+                self._waiters.move_to_end(user_id)
+            else:
+                del self._waiters[user_id]
+
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self.active -= 1
+
+    async def _run(self, user_id: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        await self._acquire(user_id)
+        try:
+            return await factory()
+        finally:
+            self._release()
+
+    async def run(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        user_id: Hashable = None,
+        key: Optional[Hashable] = None,
+    ) -> T:
+        """Run ``factory()`` through the gate; callers sharing ``key`` share the result."""
+        if key is not None:
+            existing = self._inflight.get(key)
+            if existing is not None:
+                self.coalesced += 1
+                return await asyncio.shield(existing)
+
+        task = asyncio.ensure_future(self._run(user_id, factory))
+        if key is not None:
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "shed": self.shed,
+            "coalesced": self.coalesced,
+        }
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+def load_backend_gate(name: str, max_concurrency: int) -> BackendGate:
+    """Gate for ``name`` configured from ``<NAME>_MAX_CONCURRENCY`` and friends."""
+    prefix = name.upper()
+    return BackendGate(
+        name,
+        max_concurrency=int(_env_number(f"{prefix}_MAX_CONCURRENCY", max_concurrency)),
+        max_queue=int(_env_number(f"{prefix}_MAX_QUEUE", 50)),
+        max_pending_per_user=int(_env_number(f"{prefix}_MAX_PENDING_PER_USER", 2)),
+        queue_timeout=_env_number(f"{prefix}_QUEUE_TIMEOUT_SECONDS", 10.0),
+    )
@@ -0,0 +1,127 @@
+"""Microbenchmark for the on_message gate (message_router.py).
+
+Drives a synthetic message mix through an on_message-shaped handler, once with
+the old inline mention handling (every message went on to process_commands)
+and once with MessageRouter, and prints messages per second for each. The
+command context is a stand-in with the same shape of work as
+commands.Bot.get_context for a plain string prefix, so no Discord connection
+or discord.py install is needed:
+
+    python bench_message_router.py [--messages 200000] [--chatter 0.9]
+"""
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from message_router import MessageRouter
+
+BOT_ID = 123456789012345678
+PREFIX = "!"
+
+
+def make_messages(count: int, chatter: float, seed: int = 1):
+    rng = random.Random(seed)
+    bot = SimpleNamespace(id=BOT_ID)
+    other = SimpleNamespace(id=42)
+    words = "the quick brown fox jumps over the lazy dog anyone up for a game tonight".split()
+    messages = []
+    for _ in range(count):
+        text = " ".join(rng.choices(words, k=rng.randint(3, 30)))
+        roll = rng.random()
+        if roll < chatter:
+            mentions = [other] if rng.random() < 0.05 else []
+            messages.append(SimpleNamespace(content=text, mentions=mentions))
+        elif roll < chatter + (1 - chatter) / 2:
+            messages.append(SimpleNamespace(content=f"{PREFIX}play {text}", mentions=[]))
+        else:
+            messages.append(SimpleNamespace(content=f"<@{BOT_ID}> | Zero Two's proxy - {text}", mentions=[bot]))
+    return messages
+
+
+class StringView:
+    def __init__(self, buffer: str):
+        self.index = 0
+        self.buffer = buffer
+        self.end = len(buffer)
+        self.previous = 0
+
+
+class Context:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+async def get_prefix(message) -> str:
+    return PREFIX
+
+
+async def get_context(message) -> Context:
+    """Stand-in for commands.Bot.get_context: view + context + awaited prefix lookup."""
+    view = StringView(message.content)
+    ctx = Context(prefix=None, view=view, message=message, command=None, invoked_with=None)
+    prefix = await get_prefix(message)
+    if message.content.startswith(prefix):
+        view.index = len(prefix)
+        ctx.prefix = prefix
+        ctx.invoked_with = message.content[len(prefix):].split(" ", 1)[0]
+    return ctx
+
+
+def old_route(message, bot_user):
+    """The pre-router mention handling."""
+    if message.mentions and bot_user in message.mentions:
+        content = message.content
+        content = content.replace(f"<@{bot_user.id}>", "").replace(f"<@!{bot_user.id}>", "").strip()
+        if content.startswith("|"):
+            content = content[1:].lstrip()
+        lowered = content.lower()
+        if lowered.startswith("zero two's proxy"):
+            content = content[len("zero two's proxy"):].lstrip(" -:|\t")
+        return content
+    return ""
+
+
+async def old_handler(message, bot_user) -> None:
+    old_route(message, bot_user)
+    await get_context(message)          # process_commands, for every message
+
+
+async def router_handler(message, router: MessageRouter) -> None:
+    if router.route(message) is None:
+        return
+    await get_context(message)
+
+
+async def drive(handler, messages, arg) -> None:
+    for message in messages:
+        await handler(message, arg)
+
+
+def run(label: str, handler, messages, arg) -> None:
+    started = time.perf_counter()
+    asyncio.run(drive(handler, messages, arg))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<8} {len(messages) / elapsed:>14,.0f} msg/s  ({elapsed * 1000:.1f} ms)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--chatter", type=float, default=0.9, help="share of messages with no prefix or bot mention")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.chatter)
+    router = MessageRouter(PREFIX)
+    router.bind(BOT_ID)
+    bot_user = SimpleNamespace(id=BOT_ID)
+
+    relevant = sum(router.route(message) is not None for message in messages)
+    print(f"{len(messages):,} messages, {relevant:,} need a command context (old handler: all of them)")
+    run("old", old_handler, messages, bot_user)
+    run("router", router_handler, messages, router)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import time
+from typing import Callable, Optional
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a backend that keeps failing."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Stops calls to a backend after ``failure_threshold`` consecutive failures.
+
+    While open, calls fail at once with :class:`CircuitOpen`. After
+    ``reset_timeout`` seconds one probe call is let through (half-open): success
+    closes the circuit, failure opens it again for another ``reset_timeout``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_timeout = max(float(reset_timeout), 0.0)
+        self.clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opens = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def retry_in(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(self._opened_at + self.reset_timeout - self.clock(), 0.0)
+
+    def before_call(self) -> None:
+        """Raise :class:`CircuitOpen` unless a call may go out now."""
+        if self.state == OPEN:
+            if self.retry_in() > 0:
+                self.rejected += 1
+                raise CircuitOpen(self.name, self.retry_in())
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpen(self.name, self.reset_timeout)
+            self._probing = True
+
+    def abandon(self) -> None:
+        """The call was cancelled before it finished: neither a success nor a failure."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        if self.state != OPEN:
+            self.opens += 1
+        self.state = OPEN
+        self._opened_at = self.clock()
+        self._probing = False
+
+    def describe(self) -> str:
+        text = self.state
+        if self.state == OPEN:
+            text += f" (retry in {self.retry_in():.0f}s)"
+        elif self.consecutive_failures:
+            text += f" ({self.consecutive_failures} failures in a row)"
+        return text
+
+
+def adaptive_timeout(
+    samples: int,
+    percentile_seconds: float,
+    ceiling: float,
+    multiplier: float = 3.0,
+    floor: float = 5.0,
+    min_samples: int = 20,
+) -> Optional[float]:
+    """``percentile_seconds * multiplier`` clamped to [floor, ceiling], or None with too few samples."""
+    if samples < min_samples or percentile_seconds <= 0:
+        return None
+    return min(max(percentile_seconds * multiplier, floor), ceiling)
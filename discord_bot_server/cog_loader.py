@@ -0,0 +1,159 @@
+import ast
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from discord import app_commands
+from discord.ext import commands
+
+
+log = logging.getLogger(__name__)
+
+
+def _env_list(name: str) -> Optional[Set[str]]:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return None
+    return {item.strip() for item in raw.split(",") if item.strip()}
+
+
+def scan_cog(path: str) -> Tuple[Set[str], bool]:
+    """Prefix command names (with aliases) a cog file defines, and whether it has slash commands.
+
+    Like intents_profile.declared_intents, the file is parsed rather than imported.
+    """
+    with open(path, encoding="utf-8") as source:
+        tree = ast.parse(source.read(), filename=path)
+
+    names: Set[str] = set()
+    has_app_commands = False
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            call = decorator if isinstance(decorator, ast.Call) else None
+            func = call.func if call else decorator
+            if not (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)):
+                continue
+            if func.value.id == "app_commands" and func.attr == "command":
+                has_app_commands = True
+            elif func.value.id == "commands" and func.attr in ("command", "group"):
+                keywords = {kw.arg: kw.value for kw in call.keywords} if call else {}
+                name = node.name
+                if "name" in keywords:
+                    name = ast.literal_eval(keywords["name"])
+                names.add(name)
+                if "aliases" in keywords:
+                    names.update(ast.literal_eval(keywords["aliases"]))
+    return names, has_app_commands
+
+
+@dataclass
+class CogPlan:
+    eager: List[str] = field(default_factory=list)
+    # prefix command name -> extension that defines it
+    lazy: Dict[str, str] = field(default_factory=dict)
+    disabled: List[str] = field(default_factory=list)
+
+
+def plan_cogs(cogs_dir: str) -> CogPlan:
+    """Decide which cogs load at startup, which wait for their first command and which are off.
+
+    ``BOT_COGS_ENABLED``  comma separated allow-list (default: every cog)
+    ``BOT_COGS_DISABLED`` comma separated deny-list
+    ``BOT_COGS_LAZY``     cogs that are only imported when one of their prefix commands is used
+    """
+    enabled = _env_list("BOT_COGS_ENABLED")
+    disabled = _env_list("BOT_COGS_DISABLED") or set()
+    lazy = _env_list("BOT_COGS_LAZY") or set()
+
+    plan = CogPlan()
+    for filename in sorted(os.listdir(cogs_dir)):
+        if not filename.endswith(".py"):
+            continue
+        name = filename[:-3]
+        extension = f"cogs.{name}"
+
+        if name in disabled or (enabled is not None and name not in enabled):
+            plan.disabled.append(extension)
+            continue
+
+        if name not in lazy:
+            plan.eager.append(extension)
+            continue
+
+        try:
+            command_names, has_app_commands = scan_cog(os.path.join(cogs_dir, filename))
+        except (OSError, SyntaxError, ValueError) as exc:
+            log.error("Could not scan %s for lazy loading, loading it now: %s", extension, exc)
+            plan.eager.append(extension)
+            continue
+
+        if has_app_commands or not command_names:
+            # Slash commands must be in the tree before it is synced
+            log.warning("%s has slash commands or no prefix commands; loading it eagerly", extension)
+            plan.eager.append(extension)
+            continue
+
+        for command_name in command_names:
+            plan.lazy[command_name] = extension
+
+    return plan
+
+
+async def load_extensions(bot: commands.Bot, extensions: List[str]) -> None:
+    """Load extensions concurrently, logging how long each one took."""
+
+    async def _load(extension: str):
+        started = time.perf_counter()
+        try:
+            await bot.load_extension(extension)
+        except Exception as e:
+            log.exception("Failed to load cog %s: %s", extension, e)
+            return
+        log.info("Loaded cog: %s (%.0f ms)", extension, (time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(_load(extension) for extension in extensions))
+
+
+class LazyCogs:
+    """Loads a lazy cog the first time someone uses one of its commands."""
+
+    def __init__(self, plan: CogPlan):
+        self.commands = dict(plan.lazy)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def load_for(self, bot: commands.Bot, command_name: Optional[str]) -> bool:
+        extension = self.commands.get(command_name or "")
+        if extension is None:
+            return False
+
+        lock = self._locks.setdefault(extension, asyncio.Lock())
+        async with lock:
+            if extension not in bot.extensions:
+                await load_extensions(bot, [extension])
+            # Either way the commands are real now; stop intercepting them
+            for name, owner in list(self.commands.items()):
+                if owner == extension:
+                    del self.commands[name]
+        return extension in bot.extensions
+
+
+def command_tree_hash(bot: commands.Bot) -> str:
+    """Fingerprint of the slash command definitions, used to skip redundant syncs."""
+    tree: app_commands.CommandTree = bot.tree
+    payload = []
+    for command in tree.get_commands():
+        try:
+            payload.append(command.to_dict(tree))
+        except TypeError:
+            # discord.py < 2.4 takes no tree argument
+            payload.append(command.to_dict())
+    payload.sort(key=lambda item: (item.get("type", 1), item.get("name", "")))
+    blob = json.dumps({"application_id": bot.application_id, "commands": payload}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
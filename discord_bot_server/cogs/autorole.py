@@ -1,12 +1,134 @@
+import os
+import asyncio
+from collections import deque
 import discord
 from discord.ext import commands
 from discord.ext.commands import has_permissions
 from discord import app_commands
-import sqlite3
+
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ("members",)
+
+# Role grants per second in each guild; joins above this rate wait in that guild's backlog
+try:
+    AUTO_ROLE_GRANTS_PER_SECOND = max(float(os.getenv("AUTO_ROLE_GRANTS_PER_SECOND", "5")), 0.1)
+except ValueError:
+    AUTO_ROLE_GRANTS_PER_SECOND = 5.0
+
+# Pending grants kept per guild; joins beyond this are not queued (and counted as dropped)
+try:
+    AUTO_ROLE_MAX_BACKLOG = max(int(os.getenv("AUTO_ROLE_MAX_BACKLOG", "5000")), 1)
+except ValueError:
+    AUTO_ROLE_MAX_BACKLOG = 5000
+
+# Log a warning every time a guild's backlog grows by this many pending grants
+AUTO_ROLE_BACKLOG_WARN_STEP = 500
+
+# Longest pause after Discord answers a grant with 429
+AUTO_ROLE_MAX_BACKOFF_SECONDS = 60.0
 
 class AutoRole(commands.Cog):
     def __init__(self, client):
         self.client = client
+        # guild_id -> auto_role_id (None when the guild has no auto role)
+        self.auto_roles = {}
+        # guild_id -> (member, role) grants waiting for that guild's worker
+        self.pending = {}
+        # guild_id -> worker task; a guild's worker exits once its backlog is empty
+        self._workers = {}
+        self._warned_backlog = {}
+        self.granted = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rate_limited = 0
+
+    async def cog_unload(self):
+        for worker in self._workers.values():
+            worker.cancel()
+        self._workers.clear()
+
+    @property
+    def backlog(self):
+        return sum(len(grants) for grants in self.pending.values())
+
+    def guild_backlog(self, guild_id):
+        return len(self.pending.get(guild_id, ()))
+
+    @staticmethod
+    def _retry_after(error, fallback):
+        """Seconds Discord asked us to wait in a 429 reply, or ``fallback`` when it did not say."""
+        headers = getattr(error.response, "headers", None) or {}
+        try:
+            return float(headers.get("Retry-After", fallback))
+        except (TypeError, ValueError):
+            return fallback
+
+    def queue_grant(self, member, role):
+        guild_id = member.guild.id
+        grants = self.pending.setdefault(guild_id, deque())
+        if len(grants) >= AUTO_ROLE_MAX_BACKLOG:
+            self.dropped += 1
+            if self.dropped % AUTO_ROLE_BACKLOG_WARN_STEP == 1:
+                print(f"Automatic role backlog in guild {guild_id} is full, dropped {self.dropped} grants so far")
+            return
+        grants.append((member, role))
+        warned = self._warned_backlog.get(guild_id, 0)
+        if len(grants) >= warned + AUTO_ROLE_BACKLOG_WARN_STEP:
+            self._warned_backlog[guild_id] = len(grants)
+            print(f"Automatic role backlog in guild {guild_id} is {len(grants)} pending grants")
+        if guild_id not in self._workers:
+            self._workers[guild_id] = asyncio.create_task(self.grant_worker(guild_id))
+
+    async def get_auto_role_id(self, guild_id):
+        if guild_id not in self.auto_roles:
+            result = await self.client.db.fetchone(
+                "SELECT auto_role_id FROM Auto_role WHERE guild_id = ?",
+                (guild_id,)
+            )
+            self.auto_roles[guild_id] = result[0] if result and result[0] else None
+        return self.auto_roles[guild_id]
+
+    async def grant_worker(self, guild_id):
+        """Grants one guild's pending roles at AUTO_ROLE_GRANTS_PER_SECOND, backing off on 429."""
+        interval = 1.0 / AUTO_ROLE_GRANTS_PER_SECOND
+        grants = self.pending[guild_id]
+        backoff = interval
+        try:
+            while grants:
+                member, role = grants[0]
+                try:
+                    # Skip members who left or already got the role while they were queued
+                    if member.guild.get_member(member.id) is None or role in member.roles:
+                        grants.popleft()
+                        continue
+                    await member.add_roles(role, reason="Automatic join role")
+                    self.granted += 1
+                    backoff = interval
+                except discord.Forbidden:
+                    self.failed += 1
+                    print(f"Bot lacks permission to give {role.name} in guild {guild_id}.")
+                except discord.HTTPException as e:
+                    if e.status == 429:
+                        # Keep the grant at the head and slow this guild down until Discord accepts again
+                        self.rate_limited += 1
+                        backoff = min(max(backoff * 2, self._retry_after(e, backoff)), AUTO_ROLE_MAX_BACKOFF_SECONDS)
+                        print(f"Automatic role grants rate limited in guild {guild_id}, retrying in {backoff:.1f}s")
+                        await asyncio.sleep(backoff)
+                        continue
+                    self.failed += 1
+                    print(f"Failed to give automatic role: {e}")
+                except Exception as e:
+                    # Keep the worker alive no matter what a single grant does
+                    self.failed += 1
+                    print(f"Unexpected error giving automatic role: {e}")
+                grants.popleft()
+                await asyncio.sleep(backoff)
+        finally:
+            if self._workers.get(guild_id) is asyncio.current_task():
+                del self._workers[guild_id]
+            if not grants:
+                self.pending.pop(guild_id, None)
+                self._warned_backlog.pop(guild_id, None)
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -14,31 +136,30 @@ class AutoRole(commands.Cog):
         
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
-        connection = sqlite3.connect("./servers_info/main.db")
-        cursor = connection.cursor()
-        
-        cursor.execute(
-            "SELECT auto_role_id FROM Auto_role WHERE guild_id = ?",
-            (member.guild.id,)
-        )
-
-        result = cursor.fetchone()
-
-        if result and result[0]:
-            role = member.guild.get_role(result[0])
-            if role:
-                await member.add_roles(role)
+        role_id = await self.get_auto_role_id(member.guild.id)
+
+        if role_id:
+            role = member.guild.get_role(role_id)
+            if role:
+                self.queue_grant(member, role)
         
     @app_commands.command(name="set_auto_role", description = "[ADMIN] Sets an automatic join role for this server.")
     @has_permissions(administrator=True)
     async def set_auto_role(self, interaction: discord.Interaction, role: discord.Role):
-        connection = sqlite3.connect("./servers_info/main.db")
-        cursor = connection.cursor()
-        
-        cursor.execute("UPDATE Auto_role SET auto_role_id = ? WHERE guild_id = ?", (role.id, interaction.guild_id))
-        connection.commit()
-        connection.close()
+        await self.client.db.execute("UPDATE Auto_role SET auto_role_id = ? WHERE guild_id = ?", (role.id, interaction.guild_id))
+        self.auto_roles.pop(interaction.guild_id, None)
         await interaction.response.send_message(f"Automatic join role set to {role.name}.")
+
+    @app_commands.command(name="auto_role_status", description = "[ADMIN] Shows the automatic join role backlog.")
+    @has_permissions(administrator=True)
+    async def auto_role_status(self, interaction: discord.Interaction):
+        backlog = self.guild_backlog(interaction.guild_id)
+        eta = backlog / AUTO_ROLE_GRANTS_PER_SECOND
+        await interaction.response.send_message(
+            f"Pending grants here: {backlog} (~{eta:.0f}s). All servers: granted {self.granted}, "
+            f"failed {self.failed}, dropped {self.dropped}, rate limited {self.rate_limited}.",
+            ephemeral=True
+        )
         
      # Error handling for permission-related errors
     @set_auto_role.error
@@ -47,6 +168,13 @@ class AutoRole(commands.Cog):
             await interaction.response.send_message("Command denied: You are not an Admin!", ephemeral=True)
         else:
             await interaction.response.send_message(f"An unexpected error occurred: {error}", ephemeral=True)
+
+    @auto_role_status.error
+    async def auto_role_status_error(self, interaction: discord.Interaction, error):
+        if isinstance(error, commands.MissingPermissions):
+            await interaction.response.send_message("Command denied: You are not an Admin!", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"An unexpected error occurred: {error}", ephemeral=True)
         
 async def setup(client):
     await client.add_cog(AutoRole(client))
\ No newline at end of file
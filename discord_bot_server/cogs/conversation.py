@@ -0,0 +1,70 @@
+import logging
+
+import discord
+from discord.ext import commands, tasks
+
+
+log = logging.getLogger(__name__)
+
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ("guild_messages", "message_content")
+
+SWEEP_INTERVAL_SECONDS = 60.0
+
+
+class Conversation(commands.Cog):
+    """Keeps bot.conversations (see conversation_buffer.py) in step with gateway message events."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.buffer = bot.conversations
+
+    async def cog_load(self):
+        if self.buffer.enabled:
+            self.sweep_loop.start()
+
+    async def cog_unload(self):
+        self.sweep_loop.cancel()
+
+    @tasks.loop(seconds=SWEEP_INTERVAL_SECONDS)
+    async def sweep_loop(self):
+        dropped = self.buffer.sweep()
+        if dropped:
+            log.debug("Conversation buffer dropped %s expired messages", dropped)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        # Bot messages are kept too: replies from this bot are part of the conversation
+        self.buffer.add(message)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        content = payload.data.get("content")
+        if content is not None:
+            self.buffer.edit(payload.channel_id, payload.message_id, content)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.buffer.delete(payload.channel_id, payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        for message_id in payload.message_ids:
+            self.buffer.delete(payload.channel_id, message_id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.buffer.forget_channel(channel.id)
+
+    @commands.Cog.listener()
+    async def on_thread_delete(self, thread: discord.Thread):
+        self.buffer.forget_channel(thread.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        for channel in [*guild.channels, *guild.threads]:
+            self.buffer.forget_channel(channel.id)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Conversation(bot))
@@ -1,29 +1,119 @@
+import asyncio
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, Hashable, List, Optional
 
-import aiohttp
 import discord
 from discord.ext import commands
 
-from langgraph_client import send_test_payload_to_langgraph
+from backend_gate import BackendBusy
+from cache import TTLCache
+from langgraph_client import LangGraphConfig, get_langgraph_config, normalize_prompt, send_test_payload_to_langgraph
 
 
 log = logging.getLogger(__name__)
 
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ("guild_messages", "message_content")
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> List[str]:
+    """Split text into Discord-sized chunks, preferring line and word boundaries."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n ")
+    chunks.append(text)
+    return chunks
+
+
+class StreamingReply:
+    """Posts a reply on the first chunk, then edits it at most once per interval.
+
+    Text beyond 2000 characters continues in follow-up messages.
+    """
+
+    def __init__(self, ctx: commands.Context, interval: float):
+        self.ctx = ctx
+        self.interval = interval
+        self.messages: List[discord.Message] = []
+        self.sent: List[str] = []
+        self.text = ""
+        self._last_flush = 0.0
+
+    @property
+    def started(self) -> bool:
+        return bool(self.messages)
+
+    async def update(self, text: str):
+        self.text = text
+        now = asyncio.get_running_loop().time()
+        if self.messages and now - self._last_flush < self.interval:
+            return
+        try:
+            await self.flush()
+        except discord.HTTPException as exc:
+            # Keep reading the stream; the final flush will try again
+            log.warning("LangGraph stream edit failed: %s", exc)
+
+    async def flush(self, text: Optional[str] = None):
+        if text is not None:
+            self.text = text
+        self._last_flush = asyncio.get_running_loop().time()
+        if not self.text.strip():
+            return
+
+        for index, chunk in enumerate(split_message(self.text)):
+            if index < len(self.messages):
+                if self.sent[index] != chunk:
+                    await self.messages[index].edit(content=chunk)
+                    self.sent[index] = chunk
+                continue
+
+            if index == 0:
+                message = await self.ctx.reply(chunk, mention_author=False)
+            else:
+                message = await self.ctx.send(chunk)
+            self.messages.append(message)
+            self.sent.append(chunk)
+
 
 class LangGraphTestCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.http = None
+        config = get_langgraph_config()
+        # Replies to short, context-free prompts ("help", "what can you do"); off unless LANGGRAPH_REPLY_CACHE is set
+        self.reply_cache: TTLCache[str] = TTLCache(config.reply_cache_size, config.reply_cache_ttl)
+        # guild_id -> True when the guild turned the reply cache off
+        self.cache_optout: Dict[int, bool] = {}
 
-    async def _session(self):
-        if self.http is None or self.http.closed:
-            self.http = aiohttp.ClientSession()
-        return self.http
+    async def reply_cache_allowed(self, guild_id: Optional[int]) -> bool:
+        if guild_id is None:
+            return True
+        if guild_id not in self.cache_optout:
+            row = await self.bot.db.fetchone("SELECT 1 FROM Reply_Cache_Optout WHERE guild_id = ?", (guild_id,))
+            self.cache_optout[guild_id] = row is not None
+        return not self.cache_optout[guild_id]
 
-    def cog_unload(self):
-        if self.http and not self.http.closed:
-            self.bot.loop.create_task(self.http.close())
+    async def _reply_cache_key(self, ctx: commands.Context, message_text: str, config: LangGraphConfig) -> Optional[Hashable]:
+        """Cache key for this prompt, or None when its reply should not be cached."""
+        if not config.reply_cache or len(message_text) > config.reply_cache_max_chars:
+            return None
+        # A reply to another message depends on that message, not just on the text
+        if ctx.message.reference is not None:
+            return None
+        guild_id = ctx.guild.id if ctx.guild else None
+        if not await self.reply_cache_allowed(guild_id):
+            return None
+        normalized = normalize_prompt(message_text)
+        # The payload carries the user and their history, so one member's answer is never served to another
+        return (guild_id, ctx.author.id, normalized) if normalized else None
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -32,6 +122,8 @@ class LangGraphTestCog(commands.Cog):
     def _build_payload(self, ctx: commands.Context, message_text: str) -> Dict[str, Any]:
         guild_id = str(ctx.guild.id) if ctx.guild else None
         channel_id = str(ctx.channel.id)
+        # Same-user and bot history plus reply metadata, see conversation_buffer.py
+        context = self.bot.conversations.context_for(ctx.message, self.bot.user.id if self.bot.user else None)
         payload = {
             "event": {
                 "source": "discord",
@@ -41,6 +133,8 @@ class LangGraphTestCog(commands.Cog):
                 "channel_id": channel_id,
                 "timestamp": ctx.message.created_at.isoformat(),
                 "text": message_text,
+                "history": context["history"],
+                "reply_to": context["reply_to"],
                 "message_mode": "test",
                 "test_metadata": {
                     "original_message": ctx.message.content,
@@ -61,6 +155,15 @@ class LangGraphTestCog(commands.Cog):
             await ctx.reply("Usage: !test <message>", mention_author=False)
             return
 
+        config = get_langgraph_config()
+        cache_key = await self._reply_cache_key(ctx, message_text, config)
+        if cache_key is not None:
+            cached = self.reply_cache.get(cache_key)
+            if cached is not None:
+                log.info("LangGraph reply cache hit: user=%s message_id=%s", ctx.author.id, ctx.message.id)
+                await ctx.reply(cached, mention_author=False)
+                return
+
         payload = self._build_payload(ctx, message_text)
         log.info(
             "LangGraph test command received: user=%s message_id=%s guild_id=%s channel_id=%s",
@@ -72,9 +175,29 @@ class LangGraphTestCog(commands.Cog):
         log.info("LangGraph test payload built: %s", payload)
 
         try:
+            # Identical test messages in flight together share a single request. The payload carries the
+            # author's history and the message they reply to, so only the same author and reply target match.
+            reference = ctx.message.reference
+            coalesce_key = (
+                "test",
+                ctx.channel.id,
+                ctx.author.id,
+                reference.message_id if reference else None,
+                normalize_prompt(message_text),
+            )
+            stream = StreamingReply(ctx, config.stream_edit_interval) if config.stream else None
             async with ctx.typing():
-                session = await self._session()
-                result = await send_test_payload_to_langgraph(session, payload, logger=log)
+                result = await self.bot.backend_gates["langgraph"].run(
+                    lambda: send_test_payload_to_langgraph(
+                        self.bot.http_client,
+                        payload,
+                        logger=log,
+                        config=config,
+                        on_chunk=stream.update if stream else None,
+                    ),
+                    user_id=ctx.author.id,
+                    key=coalesce_key,
+                )
 
             if not result.ok:
                 log.error(
@@ -91,15 +214,53 @@ class LangGraphTestCog(commands.Cog):
                 return
 
             reply_text = result.reply_text.strip() or "LangGraph returned an empty response."
+            if cache_key is not None and result.reply_text.strip():
+                self.reply_cache.set(cache_key, reply_text if len(reply_text) <= 2000 else reply_text[:1990] + "...")
+            if stream and stream.started:
+                # Already posted while streaming; make sure the final text is shown
+                log.info("LangGraph test reply streamed: %s", reply_text)
+                await stream.flush(reply_text)
+                return
+
             if len(reply_text) > 2000:
                 reply_text = reply_text[:1990] + "..."
 
             log.info("LangGraph test reply ready: %s", reply_text)
             await ctx.reply(reply_text, mention_author=False)
+        except BackendBusy as exc:
+            log.warning("LangGraph test request shed: %s", exc)
+            await ctx.reply("LangGraph is busy right now, try again in a moment.", mention_author=False)
         except Exception as exc:
             log.exception("Unhandled LangGraph test command failure: %s", exc)
             await ctx.reply("LangGraph bridge error: unable to complete the request.", mention_author=False)
 
+    @commands.command(name="replycache")
+    @commands.guild_only()
+    @commands.has_permissions(manage_guild=True)
+    async def reply_cache_command(self, ctx: commands.Context, setting: Optional[str] = None):
+        """Show or set whether this server's !test replies may come from the reply cache."""
+        if setting is not None:
+            setting = setting.lower()
+            if setting not in ("on", "off"):
+                await ctx.reply("Usage: !replycache [on|off]", mention_author=False)
+                return
+            if setting == "off":
+                await self.bot.db.execute("INSERT OR IGNORE INTO Reply_Cache_Optout (guild_id) VALUES (?)", (ctx.guild.id,))
+            else:
+                await self.bot.db.execute("DELETE FROM Reply_Cache_Optout WHERE guild_id = ?", (ctx.guild.id,))
+            self.cache_optout[ctx.guild.id] = setting == "off"
+
+        enabled = get_langgraph_config().reply_cache
+        allowed = await self.reply_cache_allowed(ctx.guild.id)
+        stats = self.reply_cache.stats()
+        await ctx.reply(
+            f"Reply cache: {'on' if enabled and allowed else 'off'} for this server"
+            f"{'' if enabled else ' (LANGGRAPH_REPLY_CACHE is not set)'}. "
+            f"{stats['size']}/{stats['maxsize']} replies cached, "
+            f"{stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%}).",
+            mention_author=False,
+        )
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(LangGraphTestCog(bot))
@@ -0,0 +1,332 @@
+import asyncio
+import logging
+import math
+import os
+import time
+import weakref
+from typing import Iterable
+
+import discord
+from discord.ext import commands
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN
+from lavalink_nodes import node_is_healthy, node_penalty, pool_nodes
+from metrics import MetricsRegistry, MetricsServer, Sample
+
+
+log = logging.getLogger(__name__)
+
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ("guilds",)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip() or "127.0.0.1"
+# 0 turns the HTTP endpoint off (the histograms are still recorded)
+METRICS_PORT = _env_int("METRICS_PORT", 9108)
+LOOP_LAG_SAMPLE_SECONDS = max(_env_float("LOOP_LAG_SAMPLE_SECONDS", 0.5), 0.05)
+
+CIRCUIT_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _summary_samples(stats, labels: dict) -> list:
+    """Quantiles, sum and count of an http_client.EndpointStats, as a Prometheus summary."""
+    samples = [("", {**labels, "quantile": str(q)}, stats.percentile(q * 100)) for q in (0.5, 0.95, 0.99)]
+    samples.append(("_sum", labels, stats.total_seconds))
+    samples.append(("_count", labels, stats.requests))
+    return samples
+
+
+class Monitoring(commands.Cog):
+    """Prometheus ``/metrics`` endpoint served from the bot's own event loop.
+
+    Counters that already live elsewhere (shard health, HTTP endpoint stats,
+    backend gates, music queues, Lavalink nodes) are read at scrape time, so
+    nothing extra runs per event. This cog only adds the loop lag sampler and
+    the command latency histograms.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.registry: MetricsRegistry = bot.metrics
+        self.server = None
+        self.loop_lag = 0.0
+        self.loop_lag_max = 0.0
+        self._lag_task = None
+        self._command_started = weakref.WeakKeyDictionary()
+
+        self.loop_lag_seconds = self.registry.histogram(
+            "arisu_loop_lag_seconds", "How late the event loop woke the lag sampler.", buckets=LOOP_LAG_BUCKETS
+        )
+        self.command_seconds = self.registry.histogram(
+            "arisu_command_seconds", "Command handling time.", ("command", "kind", "outcome")
+        )
+        self._register_collectors()
+
+    async def cog_load(self):
+        self._lag_task = asyncio.create_task(self._sample_loop_lag())
+        port = METRICS_PORT
+        if port <= 0:
+            log.info("Metrics endpoint disabled (METRICS_PORT=0)")
+            return
+        config = getattr(self.bot, "shard_config", None)
+        if config is not None and config.mode == "cluster":
+            # One endpoint per cluster process
+            port += config.cluster_id or 0
+        self.server = MetricsServer(self.registry, METRICS_HOST, port)
+        try:
+            await self.server.start()
+        except OSError as e:
+            log.error("Could not start metrics endpoint on %s:%s: %s", METRICS_HOST, port, e)
+            self.server = None
+
+    async def cog_unload(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        if self.server is not None:
+            await self.server.stop()
+
+    # ---------- Event loop lag ----------
+    async def _sample_loop_lag(self):
+        while True:
+            expected = time.perf_counter() + LOOP_LAG_SAMPLE_SECONDS
+            await asyncio.sleep(LOOP_LAG_SAMPLE_SECONDS)
+            lag = max(time.perf_counter() - expected, 0.0)
+            self.loop_lag = lag
+            self.loop_lag_max = max(self.loop_lag_max, lag)
+            self.loop_lag_seconds.observe(lag)
+
+    # ---------- Command latency ----------
+    @commands.Cog.listener()
+    async def on_command(self, ctx: commands.Context):
+        self._command_started[ctx] = time.perf_counter()
+
+    def _observe_command(self, ctx: commands.Context, outcome: str):
+        started = self._command_started.pop(ctx, None)
+        if started is None or ctx.command is None:
+            return
+        self.command_seconds.observe(time.perf_counter() - started, ctx.command.qualified_name, "prefix", outcome)
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx: commands.Context):
+        self._observe_command(ctx, "ok")
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx: commands.Context, error: commands.CommandError):
+        self._observe_command(ctx, "error")
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        # Measured from Discord's interaction timestamp, so it includes gateway delivery
+        elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        self.command_seconds.observe(max(elapsed, 0.0), command.qualified_name, "slash", "ok")
+
+    # ---------- Scrape-time collectors ----------
+    def _register_collectors(self):
+        r = self.registry
+        r.collector("arisu_loop_lag_last_seconds", "gauge", "Most recent event loop lag sample.", lambda: [("", {}, self.loop_lag)])
+        r.collector("arisu_loop_lag_max_seconds", "gauge", "Worst event loop lag since startup.", lambda: [("", {}, self.loop_lag_max)])
+        r.collector("arisu_loop_stalls_total", "counter", "Event loop stalls over the watchdog threshold.", self._loop_stalls)
+        r.collector("arisu_guilds", "gauge", "Guilds this process is in.", lambda: [("", {}, len(self.bot.guilds))])
+
+        r.collector("arisu_gateway_events_total", "counter", "Gateway events dispatched per shard.", self._gateway_events)
+        r.collector("arisu_gateway_event_rate", "gauge", "Gateway events per second per shard (last sample).", self._gateway_rate)
+        r.collector("arisu_gateway_latency_seconds", "gauge", "Gateway heartbeat latency per shard.", self._gateway_latency)
+        r.collector("arisu_gateway_reconnects_total", "counter", "Gateway reconnects per shard.", self._gateway_reconnects)
+
+        r.collector("arisu_music_queue_depth", "gauge", "Tracks waiting in each guild's music queue.", self._queue_depth)
+        r.collector("arisu_voice_connect_seconds", "summary", "Voice connect time, handshake included.", self._voice_connects)
+        r.collector("arisu_voice_connect_failures_total", "counter", "Voice connect attempts that failed.", self._voice_connect_failures)
+        r.collector("arisu_reclaimed_total", "counter", "Idle players disconnected and per-guild state freed.", self._reclaimed)
+        r.collector("arisu_lavalink_node_up", "gauge", "1 if the Lavalink node can take players.", self._node_up)
+        r.collector("arisu_lavalink_node_penalty", "gauge", "Lavalink load-balancing penalty per node.", self._node_penalty)
+        r.collector("arisu_lavalink_node_players", "gauge", "Players and playing players per node.", self._node_players)
+        r.collector("arisu_lavalink_node_cpu_load", "gauge", "Lavalink and system CPU load per node.", self._node_cpu)
+
+        r.collector("arisu_http_requests_total", "counter", "Requests per backend endpoint (n8n, LangGraph).", self._http_requests)
+        r.collector("arisu_http_errors_total", "counter", "Failed requests (exception or HTTP >= 400) per endpoint.", self._http_errors)
+        r.collector("arisu_http_request_seconds", "summary", "Backend request latency over recent requests.", self._http_latency)
+        r.collector("arisu_http_timeout_seconds", "gauge", "Current (adaptive) request timeout per endpoint.", self._http_timeout)
+        r.collector("arisu_circuit_state", "gauge", "Circuit breaker per endpoint: 0 closed, 1 half-open, 2 open.", self._circuit_state)
+        r.collector("arisu_circuit_opens_total", "counter", "Times each endpoint's circuit opened.", self._circuit_opens)
+        r.collector("arisu_circuit_rejected_total", "counter", "Requests failed fast by an open circuit.", self._circuit_rejected)
+
+        r.collector("arisu_conversation_buffer_messages", "gauge", "Messages held for ZeroTwo / LangGraph context.", self._conversation_size)
+        r.collector("arisu_conversation_buffer_channels", "gauge", "Channels with buffered messages.", self._conversation_channels)
+        r.collector("arisu_conversation_buffer_evicted_total", "counter", "Buffered messages dropped by TTL or the channel cap.", self._conversation_evicted)
+
+        r.collector("arisu_langgraph_reply_cache_lookups_total", "counter", "LangGraph reply cache lookups by result.", self._reply_cache_lookups)
+        r.collector("arisu_langgraph_reply_cache_entries", "gauge", "Replies held in the LangGraph reply cache.", self._reply_cache_entries)
+
+        r.collector("arisu_voice_state_outbox_backlog", "gauge", "n8n voice states waiting to be delivered.", lambda: self._outbox_field("backlog"))
+        r.collector("arisu_voice_state_outbox_oldest_seconds", "gauge", "Age of the oldest undelivered voice state.", lambda: self._outbox_field("oldest_age"))
+        r.collector("arisu_voice_state_outbox_sent_total", "counter", "Voice states delivered to n8n.", lambda: self._outbox_field("sent"))
+        r.collector("arisu_voice_state_outbox_coalesced_total", "counter", "Voice states replaced by a newer one before sending.", lambda: self._outbox_field("coalesced"))
+        r.collector("arisu_voice_state_outbox_failures_total", "counter", "Failed voice-state sends (each is retried).", lambda: self._outbox_field("failures"))
+        r.collector("arisu_voice_state_outbox_rejected_total", "counter", "Voice states n8n rejected with a 4xx (dropped).", lambda: self._outbox_field("rejected"))
+
+        r.collector("arisu_backend_active", "gauge", "Calls running per backend gate.", lambda: self._gate_field("active"))
+        r.collector("arisu_backend_waiting", "gauge", "Calls queued per backend gate.", lambda: self._gate_field("waiting"))
+        r.collector("arisu_backend_shed_total", "counter", "Calls turned away as busy per backend gate.", lambda: self._gate_field("shed"))
+
+    def _loop_stalls(self) -> Iterable[Sample]:
+        cog = self.bot.get_cog("Watchdog")
+        return [("", {}, cog.watchdog.stalls)] if cog else []
+
+    def _shards(self):
+        cog = self.bot.get_cog("ShardStats")
+        return sorted(cog.shards.items()) if cog else []
+
+    def _gateway_events(self) -> Iterable[Sample]:
+        return [("", {"shard": str(sid)}, h.events) for sid, h in self._shards()]
+
+    def _gateway_rate(self) -> Iterable[Sample]:
+        return [("", {"shard": str(sid)}, h.event_rate) for sid, h in self._shards()]
+
+    def _gateway_latency(self) -> Iterable[Sample]:
+        return [("", {"shard": str(sid)}, h.latency) for sid, h in self._shards() if not math.isnan(h.latency)]
+
+    def _gateway_reconnects(self) -> Iterable[Sample]:
+        return [("", {"shard": str(sid)}, h.reconnects) for sid, h in self._shards()]
+
+    def _queue_depth(self) -> Iterable[Sample]:
+        music = self.bot.get_cog("Music")
+        if music is None:
+            return []
+        return [("", {"guild": str(guild_id)}, len(queue)) for guild_id, queue in music.queues.items()]
+
+    def _reclaimed(self) -> Iterable[Sample]:
+        samples = []
+        music = self.bot.get_cog("Music")
+        if music is not None:
+            samples.extend(("", {"kind": kind}, count) for kind, count in sorted(music.reclaimed.items()))
+        zero_two = self.bot.get_cog("ZeroTwoCog")
+        if zero_two is not None:
+            samples.append(("", {"kind": "zerotwo_voice_state"}, zero_two.voice_state_reclaimed))
+        return samples
+
+    def _nodes(self):
+        return [(getattr(node, "label", "Unknown"), node) for node in pool_nodes(getattr(self.bot, "lavalink", None))]
+
+    def _node_up(self) -> Iterable[Sample]:
+        return [("", {"node": label}, 1.0 if node_is_healthy(node) else 0.0) for label, node in self._nodes()]
+
+    def _node_penalty(self) -> Iterable[Sample]:
+        return [("", {"node": label}, node_penalty(node)) for label, node in self._nodes()]
+
+    def _node_players(self) -> Iterable[Sample]:
+        samples = []
+        for label, node in self._nodes():
+            stats = getattr(node, "stats", None)
+            if stats is None:
+                continue
+            players = getattr(stats, "player_count", getattr(stats, "players", 0))
+            playing = getattr(stats, "playing_player_count", getattr(stats, "playing_players", 0))
+            samples.append(("", {"node": label, "state": "connected"}, players))
+            samples.append(("", {"node": label, "state": "playing"}, playing))
+        return samples
+
+    def _node_cpu(self) -> Iterable[Sample]:
+        samples = []
+        for label, node in self._nodes():
+            cpu = getattr(getattr(node, "stats", None), "cpu", None)
+            if cpu is None:
+                continue
+            samples.append(("", {"node": label, "scope": "lavalink"}, float(getattr(cpu, "lavalink_load", 0.0) or 0.0)))
+            samples.append(("", {"node": label, "scope": "system"}, float(getattr(cpu, "system_load", 0.0) or 0.0)))
+        return samples
+
+    def _http_stats(self):
+        http = getattr(self.bot, "http_client", None)
+        return sorted(http.stats.items()) if http else []
+
+    def _http_requests(self) -> Iterable[Sample]:
+        return [("", {"endpoint": name}, stats.requests) for name, stats in self._http_stats()]
+
+    def _http_errors(self) -> Iterable[Sample]:
+        return [("", {"endpoint": name}, stats.errors) for name, stats in self._http_stats()]
+
+    def _http_latency(self) -> Iterable[Sample]:
+        samples = []
+        for name, stats in self._http_stats():
+            samples.extend(_summary_samples(stats, {"endpoint": name}))
+        return samples
+
+    def _http_timeout(self) -> Iterable[Sample]:
+        http = getattr(self.bot, "http_client", None)
+        if http is None:
+            return []
+        return [("", {"endpoint": name}, seconds) for name, seconds in sorted(http.timeouts.items())]
+
+    def _breakers(self):
+        http = getattr(self.bot, "http_client", None)
+        return sorted(http.breakers.items()) if http else []
+
+    def _circuit_state(self) -> Iterable[Sample]:
+        return [("", {"endpoint": name}, CIRCUIT_STATES[b.state]) for name, b in self._breakers()]
+
+    def _circuit_opens(self) -> Iterable[Sample]:
+        return [("", {"endpoint": name}, b.opens) for name, b in self._breakers()]
+
+    def _circuit_rejected(self) -> Iterable[Sample]:
+        return [("", {"endpoint": name}, b.rejected) for name, b in self._breakers()]
+
+    def _voice_connects(self) -> Iterable[Sample]:
+        music = self.bot.get_cog("Music")
+        return _summary_samples(music.connect_stats, {}) if music else []
+
+    def _voice_connect_failures(self) -> Iterable[Sample]:
+        music = self.bot.get_cog("Music")
+        return [("", {}, music.connect_stats.errors)] if music else []
+
+    def _conversation_size(self) -> Iterable[Sample]:
+        buffer = getattr(self.bot, "conversations", None)
+        return [("", {}, len(buffer))] if buffer is not None else []
+
+    def _conversation_channels(self) -> Iterable[Sample]:
+        buffer = getattr(self.bot, "conversations", None)
+        return [("", {}, buffer.channels)] if buffer is not None else []
+
+    def _conversation_evicted(self) -> Iterable[Sample]:
+        buffer = getattr(self.bot, "conversations", None)
+        return [("", {}, buffer.evicted)] if buffer is not None else []
+
+    def _reply_cache_lookups(self) -> Iterable[Sample]:
+        cog = self.bot.get_cog("LangGraphTestCog")
+        if cog is None:
+            return []
+        return [("", {"result": "hit"}, cog.reply_cache.hits), ("", {"result": "miss"}, cog.reply_cache.misses)]
+
+    def _reply_cache_entries(self) -> Iterable[Sample]:
+        cog = self.bot.get_cog("LangGraphTestCog")
+        return [("", {}, len(cog.reply_cache))] if cog else []
+
+    def _outbox_field(self, field: str) -> Iterable[Sample]:
+        zero_two = self.bot.get_cog("ZeroTwoCog")
+        if zero_two is None:
+            return []
+        value = getattr(zero_two.voice_outbox, field)
+        return [("", {}, value() if callable(value) else value)]
+
+    def _gate_field(self, field: str) -> Iterable[Sample]:
+        gates = getattr(self.bot, "backend_gates", {})
+        return [("", {"backend": name}, gate.snapshot()[field]) for name, gate in sorted(gates.items())]
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Monitoring(bot))
@@ -1,14 +1,105 @@
 import asyncio
+import functools
+import itertools
+import math
+import os
+import random
 import re
+import time
 import logging
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import discord
 from discord.ext import commands, tasks
 import mafic
 
+from cache import TTLCache
+from http_client import EndpointStats
+from metrics import Histogram
+from lavalink_nodes import best_node, ensure_lavalink_nodes, node_is_healthy, node_penalty, pool_nodes
+from music_queue import QueueEntry, RepeatMode, TrackQueue
+from music_state import MusicStateStore, SavedSession
+
 log = logging.getLogger("music")
 
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ("voice_states",)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+# The queue advances from Lavalink track events; this poll is only a safety net (0 disables it).
+AUTOPLAY_POLL_SECONDS = _env_float("MUSIC_AUTOPLAY_POLL_SECONDS", 30.0)
+
+# How often players on a dead Lavalink node are moved to a healthy one
+NODE_FAILOVER_CHECK_SECONDS = _env_float("MUSIC_NODE_FAILOVER_CHECK_SECONDS", 5.0)
+
+# Resolved tracks shared across guilds, keyed by (search type, normalized query)
+TRACK_CACHE_SIZE = _env_int("MUSIC_TRACK_CACHE_SIZE", 1024)
+TRACK_CACHE_TTL_SECONDS = _env_float("MUSIC_TRACK_CACHE_TTL_SECONDS", 1800.0)
+
+# How often playback positions are saved, so a restart resumes close to where it stopped
+STATE_CHECKPOINT_SECONDS = _env_float("MUSIC_STATE_CHECKPOINT_SECONDS", 10.0)
+
+# Longest queue a guild can build; playlists are cut off at this length
+MAX_QUEUE_LENGTH = max(_env_int("MUSIC_MAX_QUEUE_LENGTH", 1000), 1)
+
+# Finished tracks remembered per guild for !history
+HISTORY_SIZE = _env_int("MUSIC_HISTORY_SIZE", 50)
+
+QUEUE_PAGE_SIZE = 10
+
+# Searches from !playlist resolved at once, across all guilds
+RESOLVE_CONCURRENCY = max(_env_int("MUSIC_RESOLVE_CONCURRENCY", 4), 1)
+
+# Resolved !playlist entries are queued in batches of this size (one database write each)
+ENQUEUE_BATCH_SIZE = 25
+
+# Voice connects: per-attempt timeout, attempts, and the first retry delay (doubles each time)
+CONNECT_TIMEOUT_SECONDS = _env_float("MUSIC_CONNECT_TIMEOUT_SECONDS", 10.0)
+CONNECT_ATTEMPTS = max(_env_int("MUSIC_CONNECT_ATTEMPTS", 3), 1)
+CONNECT_BACKOFF_SECONDS = 1.0
+
+# Players are disconnected after this long alone in their channel, or this long not playing (0 disables)
+ALONE_DISCONNECT_MINUTES = _env_float("MUSIC_ALONE_DISCONNECT_MINUTES", 3.0)
+IDLE_DISCONNECT_MINUTES = _env_float("MUSIC_IDLE_DISCONNECT_MINUTES", 10.0)
+REAPER_INTERVAL_SECONDS = 30.0
+
+# Queue entries checked ahead of time before giving up until the next track starts
+PRELOAD_ATTEMPTS = 5
+
+# Saved sessions reconnected at once on startup
+RESTORE_CONCURRENCY = 4
+
+URL_RE = re.compile(r"^https?://", re.IGNORECASE)
+
+
+def track_cache_key(query: str) -> tuple:
+    """URLs keep their case (paths and IDs are case-sensitive); searches are case/space-folded."""
+    query = query.strip()
+    if URL_RE.match(query):
+        return ("url", query)
+    return (mafic.SearchType.YOUTUBE.value, " ".join(query.lower().split()))
+
+
+def format_duration(ms: int) -> str:
+    seconds = max(int(ms), 0) // 1000
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
 
 def pick_first_track(result: Union[List[mafic.Track], mafic.Playlist, None]) -> Optional[mafic.Track]:
     """Handle Mafic return types: list[Track] | Playlist | None."""
@@ -25,6 +116,34 @@ def pick_first_track(result: Union[List[mafic.Track], mafic.Playlist, None]) ->
     return None
 
 
+class ArisuPlayer(mafic.Player):
+    """mafic.Player that signals when the voice handshake has finished.
+
+    Discord sends VOICE_STATE_UPDATE and VOICE_SERVER_UPDATE; once Mafic has
+    both and has handed them to Lavalink the player is connected. ``ready`` is
+    set right then, so callers can wait for it instead of polling.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ready = asyncio.Event()
+
+    def _check_ready(self) -> None:
+        if getattr(self, "connected", False):
+            self.ready.set()
+
+    async def on_voice_state_update(self, data) -> None:
+        await super().on_voice_state_update(data)
+        if data.get("channel_id") is None:
+            # Left voice: waiters must see the next handshake, not this one
+            self.ready.clear()
+        self._check_ready()
+
+    async def on_voice_server_update(self, data) -> None:
+        await super().on_voice_server_update(data)
+        self._check_ready()
+
+
 def player_is_playing(vc: object) -> bool:
     """Robust check across Mafic versions for 'is the player playing?'."""
     if not isinstance(vc, mafic.Player):
@@ -56,24 +175,111 @@ class Music(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.queues: Dict[int, asyncio.Queue[mafic.Track]] = {}
-        self.autoplay_loop.start()
+        self.queues: Dict[int, TrackQueue] = {}
+        self.advance_locks: Dict[int, asyncio.Lock] = {}
+        self.track_cache: TTLCache[mafic.Track] = TTLCache(TRACK_CACHE_SIZE, TRACK_CACHE_TTL_SECONDS)
+        if AUTOPLAY_POLL_SECONDS > 0:
+            self.autoplay_loop.change_interval(seconds=AUTOPLAY_POLL_SECONDS)
+            self.autoplay_loop.start()
+        self.failovers = 0
+        self.connect_stats = EndpointStats()
+        self.node_failover_loop.change_interval(seconds=NODE_FAILOVER_CHECK_SECONDS)
+        self.node_failover_loop.start()
+        self.state = MusicStateStore(bot.db)
+        self.resolve_semaphore = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+        # guild_id -> background task resolving a !playlist list
+        self.resolving: Dict[int, asyncio.Task] = {}
+        # guild_id -> task checking the next queued track while the current one plays
+        self.preloads: Dict[int, asyncio.Task] = {}
+        self.dead_skipped = 0
+        # Silence between one track ending and the next starting
+        self.track_ended_at: Dict[int, float] = {}
+        self.transition_gap = Histogram(
+            "arisu_music_transition_gap_seconds",
+            "Time from a track ending to the next one starting.",
+            buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0),
+        )
+        registry = getattr(bot, "metrics", None)
+        if registry is not None:
+            registry.add_histogram(self.transition_gap)
+        self.restored = False
+        self.checkpoint_loop.change_interval(seconds=STATE_CHECKPOINT_SECONDS)
+        self.checkpoint_loop.start()
+        # guild_id -> (why the player is idle, monotonic time it started)
+        self.idle_since: Dict[int, Tuple[str, float]] = {}
+        self.reclaimed: Dict[str, int] = {"alone": 0, "idle": 0, "guild_state": 0}
+        # guild_id -> monotonic time the bot's player left voice (kicked, dropped) without release_guild
+        self.players_gone: Dict[int, float] = {}
+        self.idle_reaper.start()
 
-    def get_queue(self, guild_id: int) -> asyncio.Queue[mafic.Track]:
+    async def cog_load(self):
+        # Loaded lazily after the bot is already connected: on_ready won't fire again for us
+        if self.bot.is_ready():
+            await ensure_lavalink_nodes(self.bot)
+            self._restore_task = asyncio.create_task(self.restore_sessions())
+
+    async def cog_unload(self):
+        self.autoplay_loop.cancel()
+        self.node_failover_loop.cancel()
+        self.checkpoint_loop.cancel()
+        self.idle_reaper.cancel()
+        # Also runs at shutdown, SIGTERM included (Arisu.py closes the client and unloads every cog), so the final positions are saved
+        try:
+            await self.save_positions()
+        except Exception as e:
+            log.exception("Could not save playback positions: %s", e)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await ensure_lavalink_nodes(self.bot)
+        await self.restore_sessions()
+
+    def get_queue(self, guild_id: int) -> TrackQueue:
         if guild_id not in self.queues:
-            self.queues[guild_id] = asyncio.Queue()
+            self.queues[guild_id] = TrackQueue(HISTORY_SIZE)
         return self.queues[guild_id]
 
-    async def wait_for_player_connected(self, player: mafic.Player, timeout: float = 10.0) -> None:
-        loop = asyncio.get_running_loop()
-        deadline = loop.time() + timeout
+    async def wait_for_player_connected(self, player: mafic.Player, timeout: float = CONNECT_TIMEOUT_SECONDS) -> None:
+        if getattr(player, "connected", False):
+            return
+        ready = getattr(player, "ready", None)
+        if ready is None:
+            raise commands.CommandError("Voice player is not connected.")
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise commands.CommandError("Voice connection timed out before the player finished connecting.") from None
 
-        while loop.time() < deadline:
-            if getattr(player, "connected", False):
-                return
-            await asyncio.sleep(0.1)
+    async def connect_player(self, channel: discord.abc.Connectable) -> mafic.Player:
+        """Connect to ``channel`` and wait for the voice handshake, retrying with backoff."""
+        loop = asyncio.get_running_loop()
+        delay = CONNECT_BACKOFF_SECONDS
+        for attempt in range(1, CONNECT_ATTEMPTS + 1):
+            started = loop.time()
+            try:
+                player = await channel.connect(cls=self.player_factory(), timeout=CONNECT_TIMEOUT_SECONDS)
+                await self.wait_for_player_connected(player)
+            except (asyncio.TimeoutError, commands.CommandError, discord.ClientException, mafic.MaficException) as e:
+                self.connect_stats.record(loop.time() - started, error=True)
+                # A half-open connection would make the next connect() fail with "already connected"
+                stale = channel.guild.voice_client
+                if stale is not None:
+                    ready = getattr(stale, "ready", None)
+                    if ready is not None:
+                        ready.clear()
+                    try:
+                        await stale.disconnect(force=True)
+                    except Exception:
+                        pass
+                if attempt == CONNECT_ATTEMPTS:
+                    raise commands.CommandError(f"Could not connect to {channel} after {attempt} attempts: {e}") from e
+                log.warning("Voice connect attempt %s in guild %s failed: %s", attempt, channel.guild.id, e)
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+                delay *= 2
+                continue
 
-        raise commands.CommandError("Voice connection timed out before the player finished connecting.")
+            self.connect_stats.record(loop.time() - started, error=False)
+            return player
 
     async def ensure_player(self, ctx: commands.Context) -> mafic.Player:
         """Ensure a voice connection + Mafic Player for this guild."""
@@ -97,62 +303,509 @@ class Music(commands.Cog):
                 return player
 
         log.info("Connecting to voice channel %s in guild %s", target_channel, ctx.guild.id)
-        player = await target_channel.connect(cls=mafic.Player)
-        await self.wait_for_player_connected(player)
-        return player
+        return await self.connect_player(target_channel)
 
-    # ---------- Background: auto play next ----------
-    @tasks.loop(seconds=1.0)
-    async def autoplay_loop(self):
-        for guild in list(self.bot.guilds):
-            try:
-                vc = guild.voice_client
-                if not vc or not isinstance(vc, mafic.Player):
-                    continue
-                if player_is_playing(vc):
+    def player_factory(self):
+        """ArisuPlayer bound to the least loaded healthy node (Mafic picks one if none is healthy)."""
+        node = best_node(getattr(self.bot, "lavalink", None))
+        if node is None:
+            return ArisuPlayer
+        log.info("Placing new player on node %s", getattr(node, "label", "Unknown"))
+        return functools.partial(ArisuPlayer, node=node)
+
+    async def resolve_track(self, player: mafic.Player, query: str) -> Optional[mafic.Track]:
+        """Resolve a URL or search to one track, reusing recent results from any guild."""
+        key = track_cache_key(query)
+        track = self.track_cache.get(key)
+        if track is not None:
+            log.info("Track cache hit for %s", key)
+            return track
+
+        if key[0] == "url":
+            result = await player.fetch_tracks(query)
+            log.info("Fetched tracks via URL for guild %s", player.guild.id)
+        else:
+            result = await player.fetch_tracks(query, search_type=mafic.SearchType.YOUTUBE)
+            log.info("Searched YouTube for '%s' in guild %s", query, player.guild.id)
+
+        track = pick_first_track(result)
+        if track is not None:
+            # Track carries the encoded track string, so play() needs no further lookup
+            self.track_cache.set(key, track)
+        return track
+
+    async def enqueue_many(self, guild_id: int, tracks: List[mafic.Track]) -> int:
+        """Queue tracks up to the guild's cap with one database write; returns how many fit."""
+        q = self.get_queue(guild_id)
+        if not q.seeded:
+            # Rows left from the last run (e.g. a session that was not restored) keep their seqs
+            q.seed(await self.state.next_seq(guild_id))
+        added = [QueueEntry.from_track(track) for track in tracks[: max(MAX_QUEUE_LENGTH - len(q), 0)]]
+        q.extend(added)
+        await self.state.push_many(guild_id, [(entry.seq, entry.track) for entry in added])
+        return len(added)
+
+    async def resolve_in_background(self, ctx: commands.Context, player: mafic.Player, entries: List[str]) -> None:
+        """Resolve ``!playlist`` searches concurrently and queue them in their original order."""
+
+        async def _resolve(entry: str) -> Optional[mafic.Track]:
+            async with self.resolve_semaphore:
+                try:
+                    return await self.resolve_track(player, entry)
+                except Exception as e:
+                    log.warning("Could not resolve %r in guild %s: %s", entry, ctx.guild.id, e)
+                    return None
+
+        pending = [asyncio.create_task(_resolve(entry)) for entry in entries]
+        batch: List[mafic.Track] = []
+        added = missing = 0
+        try:
+            for task in pending:
+                track = await task
+                if track is None:
+                    missing += 1
                     continue
+                batch.append(track)
+                # Flush early while nothing is playing so the first track starts right away
+                if len(batch) >= ENQUEUE_BATCH_SIZE or not player_is_playing(player):
+                    added += await self.enqueue_many(ctx.guild.id, batch)
+                    batch = []
+                    await self.play_next(player)
+                    self.schedule_preload(player)
+            added += await self.enqueue_many(ctx.guild.id, batch)
+            await self.play_next(player)
+            self.schedule_preload(player)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        dropped = len(entries) - added - missing
+        note = f", {missing} not found" if missing else ""
+        note += f", {dropped} over the queue limit" if dropped > 0 else ""
+        await ctx.send(f"✅ Added {added} of {len(entries)} tracks{note}.")
+
+    # ---------- Queue advance ----------
+    async def play_next(self, player: mafic.Player, finished_normally: bool = True) -> Optional[QueueEntry]:
+        """Start the next track (honouring the repeat mode) if the player is idle; returns it."""
+        guild = getattr(player, "guild", None)
+        if guild is None:
+            return None
+
+        lock = self.advance_locks.setdefault(guild.id, asyncio.Lock())
+        async with lock:
+            if player_is_playing(player):
+                return None
+
+            q = self.queues.get(guild.id)
+            if q is None:
+                return None
+
+            previous = q.current
+            entry, requeued = q.advance(finished_normally)
+            if entry is None:
+                return None
+            # A track repeated in track mode was not taken from the queue: no Music_Queue row to delete
+            popped_seq = None if entry is previous else entry.seq
+
+            # Start playback first; the bookkeeping below must not add to the gap
+            log.info("Auto-playing next track in guild %s: %s", guild.id, entry.title)
+            try:
+                await player.play(entry.track)
+            except mafic.PlayerNotConnected:
+                await self.wait_for_player_connected(player)
+                await player.play(entry.track)
+
+            if requeued is not None:
+                await self.state.push_many(guild.id, [(requeued.seq, requeued.track)])
+            await self.state.start_track(guild.id, player.channel.id, entry.track, popped_seq=popped_seq)
+            return entry
+
+    # ---------- Lookahead: check the next track while this one plays ----------
+    def schedule_preload(self, player: Optional[object]) -> None:
+        """Check the head of the queue in the background, if a track is playing in front of it."""
+        if not player_is_playing(player) or getattr(player, "guild", None) is None:
+            return
+        guild = player.guild
+        task = self.preloads.get(guild.id)
+        if task is not None and not task.done():
+            return
+        self.preloads[guild.id] = asyncio.create_task(self.preload_next(player))
+
+    async def preload_next(self, player: mafic.Player) -> None:
+        """Make sure the head of the queue still loads, dropping dead entries before they are due.
 
-                q = self.get_queue(guild.id)
-                if not q.empty():
-                    next_track = await q.get()
-                    title = getattr(next_track, "title", "unknown")
-                    log.info("Auto-playing next track in guild %s: %s", guild.id, title)
-                    await vc.play(next_track)
+        Loading the source also warms Lavalink's caches for it, so the real
+        play() at the end of the current track starts faster.
+        """
+        guild_id = player.guild.id
+        q = self.queues.get(guild_id)
+        for _ in range(PRELOAD_ATTEMPTS):
+            if not q:
+                return
+            entry = q[0]
+            if entry.ready or not entry.uri:
+                return
+
+            try:
+                async with self.resolve_semaphore:
+                    result = await player.fetch_tracks(entry.uri)
             except Exception as e:
-                log.exception("Autoplay loop error in guild %s: %s", guild.id, e)
+                # Lavalink or network trouble, not proof the track is gone: try again at play time
+                log.warning("Preload of %r failed in guild %s: %s", entry.title, guild_id, e)
+                return
+
+            if not q or q[0] is not entry:
+                # The queue changed while we were loading; check the new head
+                continue
+            if pick_first_track(result) is not None:
+                entry.ready = True
+                return
+
+            log.warning("Skipping unavailable track %r in guild %s", entry.title, guild_id)
+            q.remove(0)
+            self.dead_skipped += 1
+            await self.state.remove(guild_id, [entry.seq])
+
+    @commands.Cog.listener()
+    async def on_track_start(self, event: mafic.TrackStartEvent):
+        player = event.player
+        guild = getattr(player, "guild", None)
+        if guild is None:
+            return
+        ended_at = self.track_ended_at.pop(guild.id, None)
+        if ended_at is not None:
+            self.transition_gap.observe(time.perf_counter() - ended_at)
+        self.schedule_preload(player)
+
+    @commands.Cog.listener()
+    async def on_track_end(self, event: mafic.TrackEndEvent):
+        # REPLACED means play() already started another track on this player
+        if getattr(event, "reason", None) == mafic.EndReason.REPLACED:
+            return
+        player = event.player
+        self.track_ended_at[player.guild.id] = time.perf_counter()
+        # Skipped or failed tracks are not repeated by !loop track
+        finished = getattr(event, "reason", None) == mafic.EndReason.FINISHED
+        try:
+            await self.play_next(player, finished_normally=finished)
+            if not player_is_playing(player):
+                # Nothing followed: this was not a transition
+                self.track_ended_at.pop(player.guild.id, None)
+                await self.state.clear_track(player.guild.id)
+        except Exception as e:
+            log.exception("Queue advance failed after track end: %s", e)
+
+    @commands.Cog.listener()
+    async def on_track_exception(self, event: mafic.TrackExceptionEvent):
+        # Lavalink follows this with a track end (reason LOAD_FAILED), which advances the queue.
+        guild = getattr(event.player, "guild", None)
+        log.error(
+            "Track exception in guild %s: %s",
+            getattr(guild, "id", None),
+            getattr(event, "exception", None),
+        )
+
+    # ---------- Background: safety net for missed track events ----------
+    @tasks.loop(seconds=30.0)
+    async def autoplay_loop(self):
+        # Only guilds with an active player; bot.voice_clients is much smaller than bot.guilds
+        for vc in list(self.bot.voice_clients):
+            if not isinstance(vc, mafic.Player):
+                continue
+            try:
+                await self.play_next(vc)
+            except Exception as e:
+                log.exception("Autoplay loop error in guild %s: %s", getattr(vc.guild, "id", None), e)
 
     @autoplay_loop.before_loop
     async def before_autoplay_loop(self):
         await self.bot.wait_until_ready()
 
+    # ---------- Persistence: survive restarts ----------
+    async def save_positions(self) -> None:
+        positions = [
+            (vc.guild.id, int(getattr(vc, "position", 0) or 0))
+            for vc in self.bot.voice_clients
+            if isinstance(vc, mafic.Player) and player_is_playing(vc)
+        ]
+        await self.state.save_positions(positions)
+
+    @tasks.loop(seconds=10.0)
+    async def checkpoint_loop(self):
+        try:
+            await self.save_positions()
+        except Exception as e:
+            log.exception("Checkpointing playback positions failed: %s", e)
+
+    @checkpoint_loop.before_loop
+    async def before_checkpoint_loop(self):
+        await self.bot.wait_until_ready()
+
+    async def restore_sessions(self) -> None:
+        """Rejoin the voice channels saved before the last shutdown and resume playback."""
+        if self.restored:
+            return
+        self.restored = True
+
+        # Nodes connect in the background; give them a moment before placing players
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + 30.0
+        while best_node(getattr(self.bot, "lavalink", None)) is None:
+            if loop.time() > deadline:
+                log.error("No healthy Lavalink node; saved music sessions were not restored")
+                return
+            await asyncio.sleep(1.0)
+
+        sessions = await self.state.load()
+        if not sessions:
+            return
+        semaphore = asyncio.Semaphore(RESTORE_CONCURRENCY)
+
+        async def _restore(saved: SavedSession):
+            async with semaphore:
+                try:
+                    await self.restore_session(saved)
+                except Exception as e:
+                    log.exception("Could not restore music in guild %s: %s", saved.guild_id, e)
+
+        await asyncio.gather(*(_restore(saved) for saved in sessions))
+
+    async def restore_session(self, saved: SavedSession) -> None:
+        guild = self.bot.get_guild(saved.guild_id)
+        if guild is None:
+            # Another shard/cluster owns it
+            return
+        if guild.voice_client is not None:
+            return
+
+        channel = guild.get_channel(saved.channel_id)
+        listeners = [m for m in getattr(channel, "members", ()) if not m.bot]
+        if not isinstance(channel, discord.abc.Connectable) or not listeners or (saved.track is None and not saved.queue):
+            await self.state.forget(guild.id)
+            return
+
+        try:
+            player = await self.connect_player(channel)
+        except Exception:
+            # Giving up on this session: don't leave its rows behind for the next !play
+            await self.state.forget(guild.id)
+            raise
+
+        # Decoding brings back the titles and lengths !queue shows
+        encoded = ([saved.track] if saved.track else []) + [track for _, track in saved.queue]
+        tracks = await player.node.decode_tracks(encoded)
+        q = self.get_queue(guild.id)
+        if saved.track:
+            q.current = QueueEntry.from_track(tracks.pop(0))
+        entries = [QueueEntry.from_track(track) for track in tracks]
+        for entry, (seq, _) in zip(entries, saved.queue):
+            entry.seq = seq
+        q.restore(entries)
+        q.seed(max((seq for seq, _ in saved.queue), default=0) + 1)
+
+        if q.current is not None:
+            await player.play(q.current.track, start_time=saved.position_ms)
+        else:
+            await self.play_next(player)
+        log.info(
+            "Restored music in guild %s: resumed at %ss with %d queued",
+            guild.id, saved.position_ms // 1000, len(q),
+        )
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        if self.bot.user is None or member.id != self.bot.user.id or self.bot.is_closed():
+            return
+        if after.channel is None:
+            # Kicked from voice (a channel switch reconnects right away): nothing to rejoin later
+            if member.guild.voice_client is None:
+                self.players_gone.setdefault(member.guild.id, time.monotonic())
+                await self.state.forget(member.guild.id)
+        else:
+            self.players_gone.pop(member.guild.id, None)
+            if before.channel is not None and before.channel.id != after.channel.id:
+                await self.state.set_channel(member.guild.id, after.channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        await self.release_guild(guild.id)
+
+    # ---------- Background: idle player reaper ----------
+    async def release_guild(self, guild_id: int) -> None:
+        """Drop everything kept for a guild: queue, locks, background tasks and the saved session."""
+        had_state = self.queues.pop(guild_id, None) is not None
+        self.advance_locks.pop(guild_id, None)
+        self.track_ended_at.pop(guild_id, None)
+        self.idle_since.pop(guild_id, None)
+        self.players_gone.pop(guild_id, None)
+        for tasks_by_guild in (self.preloads, self.resolving):
+            task = tasks_by_guild.pop(guild_id, None)
+            if task is not None:
+                had_state = True
+                task.cancel()
+        if had_state:
+            self.reclaimed["guild_state"] += 1
+        await self.state.forget(guild_id)
+
+    def idle_reason(self, player: mafic.Player) -> Optional[str]:
+        channel = getattr(player, "channel", None)
+        if not any(not member.bot for member in getattr(channel, "members", ())):
+            return "alone"
+        if not player_is_playing(player) or getattr(player, "paused", False):
+            return "idle"
+        return None
+
+    @tasks.loop(seconds=REAPER_INTERVAL_SECONDS)
+    async def idle_reaper(self):
+        now = time.monotonic()
+        limits = {"alone": ALONE_DISCONNECT_MINUTES * 60, "idle": IDLE_DISCONNECT_MINUTES * 60}
+        connected = set()
+
+        for vc in list(self.bot.voice_clients):
+            if not isinstance(vc, mafic.Player):
+                continue
+            guild_id = vc.guild.id
+            connected.add(guild_id)
+            reason = self.idle_reason(vc)
+            if reason is None:
+                self.idle_since.pop(guild_id, None)
+                continue
+
+            previous = self.idle_since.get(guild_id)
+            if previous is None or previous[0] != reason:
+                self.idle_since[guild_id] = (reason, now)
+                continue
+            if limits[reason] <= 0 or now - previous[1] < limits[reason]:
+                continue
+
+            log.info("Disconnecting %s player in guild %s", reason, guild_id)
+            try:
+                await vc.disconnect(force=True)
+            except Exception as e:
+                log.warning("Could not disconnect idle player in guild %s: %s", guild_id, e)
+            self.reclaimed[reason] += 1
+            await self.release_guild(guild_id)
+
+        # State left behind by players that went away (kicked, dropped voice): free it once they stay gone.
+        # Queues that never had a player (!queue, !loop before !play) are not touched.
+        for guild_id, gone_at in list(self.players_gone.items()):
+            if guild_id in connected:
+                del self.players_gone[guild_id]
+            elif now - gone_at >= REAPER_INTERVAL_SECONDS and guild_id not in self.resolving:
+                await self.release_guild(guild_id)
+
+    @idle_reaper.before_loop
+    async def before_idle_reaper(self):
+        await self.bot.wait_until_ready()
+
+    # ---------- Background: Lavalink node failover ----------
+    async def migrate_player(self, player: mafic.Player, node) -> None:
+        """Move a player to another node and resume its track at the same position.
+
+        The old node is usually dead, so nothing is asked of it (Mafic's
+        ``transfer_to`` fetches the player from it and destroys it there). The
+        player is rebuilt on ``node`` from what the bot already holds: the voice
+        session Discord gave us, the current track and the position.
+        """
+        session_id = getattr(player, "_session_id", None)
+        server_state = getattr(player, "_server_state", None)
+        if session_id is None or server_state is None:
+            raise RuntimeError("The player has no voice session to move.")
+        track = getattr(player, "current", None)
+        position = int(getattr(player, "position", 0) or 0)
+        paused = bool(getattr(player, "paused", False))
+
+        old_node = getattr(player, "node", None)
+        if old_node is not None:
+            # Only drops Mafic's local bookkeeping; no request goes to the old node
+            old_node.remove_player(player.guild.id)
+        player._node = node
+        node.add_player(player.guild.id, player)
+        await node.voice_update(
+            guild_id=player.guild.id,
+            session_id=session_id,
+            data=server_state,
+            channel_id=int(player.channel.id),
+        )
+        # The last state the dead node reported may say disconnected; play() refuses to update such a player
+        player._connected = True
+
+        if track is not None:
+            await player.play(track, start_time=position, pause=paused)
+        self.failovers += 1
+
+    @tasks.loop(seconds=5.0)
+    async def node_failover_loop(self):
+        pool = getattr(self.bot, "lavalink", None)
+        if pool is None:
+            return
+
+        for vc in list(self.bot.voice_clients):
+            if not isinstance(vc, mafic.Player):
+                continue
+            node = getattr(vc, "node", None)
+            if node is None or node_is_healthy(node):
+                continue
+
+            target = best_node(pool, exclude=[node])
+            if target is None:
+                log.warning("Lavalink node %s is down and no healthy node is available", getattr(node, "label", "Unknown"))
+                return
+
+            try:
+                await self.migrate_player(vc, target)
+                log.info(
+                    "Moved player in guild %s from node %s to %s",
+                    vc.guild.id,
+                    getattr(node, "label", "Unknown"),
+                    getattr(target, "label", "Unknown"),
+                )
+            except Exception as e:
+                log.exception("Failed to move player in guild %s: %s", vc.guild.id, e)
+
+    @node_failover_loop.before_loop
+    async def before_node_failover_loop(self):
+        await self.bot.wait_until_ready()
+
     # ---------- Diagnostics ----------
     @commands.command(help="Show Lavalink/player diagnostics.")
     async def diag(self, ctx: commands.Context):
         pool = getattr(self.bot, "lavalink", None)
-        label, connected, nodes_count = "None", False, 0
-        if pool and hasattr(pool, "nodes"):
-            try:
-                nodes = list(pool.nodes.values())
-                nodes_count = len(nodes)
-                if nodes:
-                    label = getattr(nodes[0], "label", "Unknown")
-                    connected = bool(getattr(nodes[0], "connected", False))
-            except Exception:
-                pass
-
+        nodes = pool_nodes(pool)
         vc = ctx.voice_client
+
+        # The node this guild's player lives on, else the first one
+        node = getattr(vc, "node", None) or (nodes[0] if nodes else None)
+        label = getattr(node, "label", "Unknown") if node else "None"
+        connected = node_is_healthy(node) if node else False
+        node_lines = "".join(
+            f"  - {getattr(n, 'label', 'Unknown')}: healthy={node_is_healthy(n)} penalty={node_penalty(n):.1f}\n"
+            for n in nodes
+        )
+
         q = self.get_queue(ctx.guild.id)
         playing = player_is_playing(vc)
+        cache = self.track_cache.stats()
+        gaps, gap_seconds = self.transition_gap.totals()
+        gap_mean = f"{gap_seconds / gaps * 1000:.0f}ms over {gaps}" if gaps else "n/a"
 
         await ctx.send(
             "```yaml\n"
             f"guild: {ctx.guild.id}\n"
-            f"nodes_count: {nodes_count}\n"
+            f"nodes_count: {len(nodes)}\n"
+            f"nodes:\n{node_lines}"
             f"node: {label}\n"
             f"node_connected: {connected}\n"
+            f"failovers: {self.failovers}\n"
+            f"voice_connects: {self.connect_stats.requests} (failed {self.connect_stats.errors}, "
+            f"p50 {self.connect_stats.percentile(50) * 1000:.0f}ms, p95 {self.connect_stats.percentile(95) * 1000:.0f}ms)\n"
             f"player_present: {isinstance(vc, mafic.Player)}\n"
             f"playing: {playing}\n"
-            f"queue_size: {q.qsize()}\n"
+            f"queue_size: {len(q)}\n"
+            f"transition_gap: {gap_mean}\n"
+            f"dead_tracks_skipped: {self.dead_skipped}\n"
+            f"reclaimed: {self.reclaimed}\n"
+            f"track_cache: {cache['size']}/{cache['maxsize']} (hits {cache['hits']}, misses {cache['misses']})\n"
             "```"
         )
 
@@ -167,38 +820,89 @@ class Music(commands.Cog):
         player = await self.ensure_player(ctx)
 
         try:
-            if re.match(r"^https?://", query, re.IGNORECASE):
-                result = await player.fetch_tracks(query)
-                log.info("Fetched tracks via URL for guild %s", ctx.guild.id)
-            else:
-                result = await player.fetch_tracks(query, search_type=mafic.SearchType.YOUTUBE)
-                log.info("Searched YouTube for '%s' in guild %s", query, ctx.guild.id)
+            track = await self.resolve_track(player, query)
         except Exception as e:
             log.exception("Search failed: %s", e)
             await ctx.send(f"Search failed: `{e}`")
             return
 
-        track = pick_first_track(result)
         if not track:
             await ctx.send("No results found.")
             return
 
-        if not player_is_playing(player):
-            try:
-                await player.play(track)
-            except mafic.PlayerNotConnected:
-                await self.wait_for_player_connected(player)
-                await player.play(track)
+        q = self.get_queue(ctx.guild.id)
+        if not await self.enqueue_many(ctx.guild.id, [track]):
+            await ctx.send(f"The queue is full ({MAX_QUEUE_LENGTH} tracks).")
+            return
 
-            title = getattr(track, "title", "unknown")
-            log.info("Now playing in guild %s: %s", ctx.guild.id, title)
-            await ctx.send(f"▶️ Now playing: **{title}**")
+        title = getattr(track, "title", "unknown")
+        started = await self.play_next(player)
+        if started is not None:
+            # An idle player with older tracks queued starts the head of the queue, not this one
+            log.info("Now playing in guild %s: %s", ctx.guild.id, started.title)
+            if started.track == getattr(track, "id", None):
+                await ctx.send(f"▶️ Now playing: **{started.title}**")
+            else:
+                await ctx.send(f"▶️ Now playing: **{started.title}** (queued **{title}** at #{len(q)})")
         else:
-            q = self.get_queue(ctx.guild.id)
-            await q.put(track)
-            title = getattr(track, "title", "unknown")
+            self.schedule_preload(player)
             log.info("Queued in guild %s: %s", ctx.guild.id, title)
-            await ctx.send(f"➕ Queued: **{title}**")
+            await ctx.send(f"➕ Queued at #{len(q)}: **{title}**")
+
+    @commands.command(
+        aliases=["pl"],
+        help="Queue a whole playlist URL, or several searches separated by new lines or ';'.",
+    )
+    async def playlist(self, ctx: commands.Context, *, query: str):
+        player = await self.ensure_player(ctx)
+        guild_id = ctx.guild.id
+        if guild_id in self.resolving:
+            await ctx.send("Still adding the previous list, try again when it is done.")
+            return
+
+        entries = [entry.strip() for entry in re.split(r"[\n;]", query) if entry.strip()]
+        if not entries:
+            await ctx.send("Nothing to queue.")
+            return
+
+        room = MAX_QUEUE_LENGTH - len(self.get_queue(guild_id))
+        if room <= 0:
+            await ctx.send(f"The queue is full ({MAX_QUEUE_LENGTH} tracks).")
+            return
+
+        if len(entries) == 1 and URL_RE.match(entries[0]):
+            # Lavalink returns every track of a playlist URL in one load
+            try:
+                result = await player.fetch_tracks(entries[0])
+            except Exception as e:
+                log.exception("Playlist load failed: %s", e)
+                await ctx.send(f"Playlist load failed: `{e}`")
+                return
+            tracks = list(result.tracks) if isinstance(result, mafic.Playlist) else list(result or [])
+            if not tracks:
+                await ctx.send("No results found.")
+                return
+
+            added = await self.enqueue_many(guild_id, tracks)
+            await self.play_next(player)
+            self.schedule_preload(player)
+            name = getattr(result, "name", None) or "playlist"
+            dropped = f" ({len(tracks) - added} over the queue limit)" if added < len(tracks) else ""
+            log.info("Queued %d tracks from %s in guild %s", added, name, guild_id)
+            await ctx.send(f"➕ Queued {added} tracks from **{name}**{dropped}.")
+            return
+
+        # Searches take one Lavalink lookup each: confirm now, resolve in the background
+        await ctx.send(f"⏳ Adding {min(len(entries), room)} tracks in the background...")
+        task = asyncio.create_task(self.resolve_in_background(ctx, player, entries[:room]))
+        self.resolving[guild_id] = task
+        task.add_done_callback(functools.partial(self._resolving_done, guild_id))
+
+    def _resolving_done(self, guild_id: int, task: asyncio.Task) -> None:
+        if self.resolving.get(guild_id) is task:
+            del self.resolving[guild_id]
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Background playlist resolve failed in guild %s", guild_id, exc_info=task.exception())
 
     @commands.command(help="Skip the current track.")
     async def skip(self, ctx: commands.Context):
@@ -212,22 +916,108 @@ class Music(commands.Cog):
     @commands.command(help="Stop playback and clear the queue.")
     async def stop(self, ctx: commands.Context):
         player = ctx.voice_client
-        q = self.get_queue(ctx.guild.id)
-        while not q.empty():
-            try:
-                q.get_nowait()
-                q.task_done()
-            except Exception:
-                break
+        resolving = self.resolving.pop(ctx.guild.id, None)
+        if resolving is not None:
+            resolving.cancel()
+        self.get_queue(ctx.guild.id).clear()
+        await self.state.forget(ctx.guild.id)
         if player and isinstance(player, mafic.Player):
             await player.stop()
         await ctx.send("⏹️ Stopped and cleared the queue.")
 
+    # ---------- Queue commands ----------
+    @commands.command(name="queue", aliases=["q"], help="Show the queue, 10 tracks per page.")
+    async def show_queue(self, ctx: commands.Context, page: int = 1):
+        q = self.get_queue(ctx.guild.id)
+        pages = max(math.ceil(len(q) / QUEUE_PAGE_SIZE), 1)
+        page = min(max(page, 1), pages)
+        start = (page - 1) * QUEUE_PAGE_SIZE
+
+        lines = []
+        if q.current is not None:
+            lines.append(f"Now: {q.current.title} [{format_duration(q.current.length)}]")
+        for index, entry in enumerate(itertools.islice(q, start, start + QUEUE_PAGE_SIZE), start=start + 1):
+            lines.append(f"{index}. {entry.title} [{format_duration(entry.length)}]")
+        if not q:
+            lines.append("The queue is empty.")
+        lines.append(
+            f"page {page}/{pages} | {len(q)} tracks | {format_duration(q.total_length)} | loop: {q.repeat.value}"
+        )
+        await ctx.send("```\n" + "\n".join(lines).replace("`", "'") + "\n```")
+
+    @commands.command(help="Remove the track at a queue position.")
+    async def remove(self, ctx: commands.Context, position: int):
+        q = self.get_queue(ctx.guild.id)
+        if not 1 <= position <= len(q):
+            await ctx.send(f"No track at position {position}.")
+            return
+        entry = q.remove(position - 1)
+        await self.state.remove(ctx.guild.id, [entry.seq])
+        self.schedule_preload(ctx.voice_client)
+        await ctx.send(f"🗑️ Removed **{entry.title}**.")
+
+    @commands.command(help="Move a track to another queue position, e.g. !move 5 1.")
+    async def move(self, ctx: commands.Context, source: int, destination: int):
+        q = self.get_queue(ctx.guild.id)
+        if not (1 <= source <= len(q) and 1 <= destination <= len(q)):
+            await ctx.send(f"Positions must be between 1 and {len(q)}.")
+            return
+        entry = q.move(source - 1, destination - 1)
+        q.renumber()
+        await self.state.rewrite_queue(ctx.guild.id, [(e.seq, e.track) for e in q])
+        self.schedule_preload(ctx.voice_client)
+        await ctx.send(f"↕️ Moved **{entry.title}** to #{destination}.")
+
+    @commands.command(help="Shuffle the queue.")
+    async def shuffle(self, ctx: commands.Context):
+        q = self.get_queue(ctx.guild.id)
+        if len(q) < 2:
+            await ctx.send("Not enough tracks to shuffle.")
+            return
+        q.shuffle()
+        q.renumber()
+        await self.state.rewrite_queue(ctx.guild.id, [(e.seq, e.track) for e in q])
+        self.schedule_preload(ctx.voice_client)
+        await ctx.send(f"🔀 Shuffled {len(q)} tracks.")
+
+    @commands.command(name="loop", help="Repeat mode: off, track or queue (no argument cycles through them).")
+    async def loop_mode(self, ctx: commands.Context, mode: Optional[str] = None):
+        q = self.get_queue(ctx.guild.id)
+        if mode is None:
+            modes = list(RepeatMode)
+            q.repeat = modes[(modes.index(q.repeat) + 1) % len(modes)]
+        else:
+            try:
+                q.repeat = RepeatMode(mode.lower())
+            except ValueError:
+                await ctx.send("Loop mode must be off, track or queue.")
+                return
+        await ctx.send(f"🔁 Loop: **{q.repeat.value}**")
+
+    @commands.command(help="Remove duplicate tracks from the queue.")
+    async def dedupe(self, ctx: commands.Context):
+        q = self.get_queue(ctx.guild.id)
+        removed = q.dedupe()
+        await self.state.remove(ctx.guild.id, [entry.seq for entry in removed])
+        self.schedule_preload(ctx.voice_client)
+        await ctx.send(f"🧹 Removed {len(removed)} duplicate tracks.")
+
+    @commands.command(help="Show recently played tracks.")
+    async def history(self, ctx: commands.Context):
+        q = self.get_queue(ctx.guild.id)
+        recent = list(q.history)[-QUEUE_PAGE_SIZE:][::-1]
+        if not recent:
+            await ctx.send("Nothing has been played yet.")
+            return
+        lines = [f"{index}. {entry.title}" for index, entry in enumerate(recent, start=1)]
+        await ctx.send("```\n" + "\n".join(lines).replace("`", "'") + "\n```")
+
     @commands.command(help="Disconnect the bot from voice.")
     async def leave(self, ctx: commands.Context):
         player = ctx.voice_client
         if player and isinstance(player, mafic.Player):
             await player.disconnect()
+            await self.release_guild(ctx.guild.id)
             await ctx.send("👋 Left the channel.")
         else:
             await ctx.send("I’m not in a voice channel.")
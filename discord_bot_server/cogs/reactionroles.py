@@ -5,59 +5,148 @@ from discord.ext.commands import has_permissions
 import sqlite3
 import re
 
+from intents_profile import member_for
+
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ("guild_reactions",)
+
+
+# Transaction bodies, run on the database thread via client.db.run()
+def _set_reaction_role(connection, message_id, emoji, role_id):
+    cursor = connection.cursor()
+
+    # Check if the combination of message_id and role_id exists
+    cursor.execute(
+        "SELECT COUNT(*) FROM Reaction_Role WHERE message_id = ? AND role_id = ?",
+        (message_id, role_id)
+    )
+    result = cursor.fetchone()
+
+    if result[0] > 0:
+        # If entry exists, update the reaction for the role
+        cursor.execute(
+            "UPDATE Reaction_Role SET reaction = ? WHERE message_id = ? AND role_id = ?",
+            (emoji, message_id, role_id)
+        )
+    else:
+        # If no entry exists, insert a new one
+        cursor.execute(
+            "INSERT INTO Reaction_Role (message_id, reaction, role_id) VALUES (?, ?, ?)",
+            (message_id, emoji, role_id)
+        )
+
+
+def _remove_reaction_role(connection, message_id, emoji, role_id):
+    cursor = connection.cursor()
+
+    # If the entry exists, delete it
+    cursor.execute(
+        "DELETE FROM Reaction_Role WHERE message_id = ? AND role_id = ? AND reaction = ?",
+        (message_id, role_id, emoji)
+    )
+    if cursor.rowcount == 0:
+        return False
+
+    # Commit the transaction before running VACUUM
+    connection.commit()
+
+    # Now run VACUUM to reclaim space
+    cursor.execute("VACUUM")
+    return True
+
+
 class ReactionRole(commands.Cog):
     def __init__(self, client):
         self.client = client
+        # In-memory copy of Reaction_Role: {(message_id, reaction): [role_id, ...]} in row order
+        self.reaction_roles = {}
+        # Message IDs with at least one reaction role, so untracked messages are dropped early
+        self.tracked_messages = set()
+
+    async def cog_load(self):
+        await self.load_reaction_roles()
+
+    async def load_reaction_roles(self):
+        """Build the reaction role index from the database (once, at startup)."""
+        rows = await self.client.db.fetchall(
+            "SELECT message_id, reaction, role_id FROM Reaction_Role ORDER BY rowid"
+        )
+
+        self.reaction_roles.clear()
+        self.tracked_messages.clear()
+        for message_id, reaction, role_id in rows:
+            # Several roles may share one reaction on a message: keep them all
+            role_ids = self.reaction_roles.setdefault((int(message_id), str(reaction)), [])
+            if int(role_id) not in role_ids:
+                role_ids.append(int(role_id))
+            self.tracked_messages.add(int(message_id))
+
+        print(f"Loaded {len(rows)} reaction roles")
+
+    def _index_set(self, message_id: int, reaction: str, role_id: int):
+        # A role has a single reaction per message (see admin_set_reaction_role)
+        for key, role_ids in list(self.reaction_roles.items()):
+            if key[0] == message_id and role_id in role_ids:
+                self._index_remove(key[0], key[1], role_id)
+        role_ids = self.reaction_roles.setdefault((message_id, reaction), [])
+        if role_id not in role_ids:
+            role_ids.append(role_id)
+        self.tracked_messages.add(message_id)
+
+    def _index_remove(self, message_id: int, reaction: str, role_id: int):
+        # Only this role: other rows with the same message and reaction keep granting theirs
+        role_ids = self.reaction_roles.get((message_id, reaction))
+        if role_ids and role_id in role_ids:
+            role_ids.remove(role_id)
+            if not role_ids:
+                del self.reaction_roles[(message_id, reaction)]
+        if not any(key[0] == message_id for key in self.reaction_roles):
+            self.tracked_messages.discard(message_id)
 
     @commands.Cog.listener()
     async def on_ready(self):
         print(f"{__name__} is online")
 
     async def process_reaction(self, payload, add_role: bool):
-        guild = self.client.get_guild(payload.guild_id)
-        if not guild:
-            print("Guild not found.")
+        # Fast path: most reactions are on messages without reaction roles
+        if payload.message_id not in self.tracked_messages:
             return
 
-        reaction_value = payload.emoji.id if payload.emoji.is_custom_emoji() else payload.emoji.name
-        
-
-        # Connect to the database
-        connection = sqlite3.connect("./servers_info/main.db")
-        cursor = connection.cursor()
-
-        # Fetch role associated with message and emoji
-        cursor.execute(
-            "SELECT role_id FROM Reaction_Role WHERE message_id = ? AND reaction = ?",
-            (payload.message_id, reaction_value)
-        )
-        result = cursor.fetchone()
-        connection.close()
+        reaction_value = str(payload.emoji.id) if payload.emoji.is_custom_emoji() else payload.emoji.name
+        role_ids = self.reaction_roles.get((payload.message_id, reaction_value))
+        if not role_ids:
+            return
 
-        if not result:
-            print(f"No role found for message ID {payload.message_id} and emoji {payload.emoji.name}")
+        guild = self.client.get_guild(payload.guild_id)
+        if not guild:
+            print("Guild not found.")
             return
 
-        role_id = result[0]
-        role = guild.get_role(role_id)
-        if not role:
-            print(f"Role with ID {role_id} not found.")
+        roles = []
+        for role_id in role_ids:
+            role = guild.get_role(role_id)
+            if role:
+                roles.append(role)
+            else:
+                print(f"Role with ID {role_id} not found.")
+        if not roles:
             return
 
-        # Get the member who reacted
-        member = guild.get_member(payload.user_id) or await guild.fetch_member(payload.user_id)
+        # Get the member who reacted (looked up on demand: the minimal profile keeps a partial member cache)
+        member = await member_for(self.client, guild, payload.user_id)
         if not member:
             print("Member not found.")
             return
 
-        # Add or remove the role
+        # Add or remove the roles
+        names = ", ".join(role.name for role in roles)
         try:
             if add_role:
-                await member.add_roles(role)
-                print(f"{member.name} now has the role {role.name}")
+                await member.add_roles(*roles)
+                print(f"{member.name} now has the role {names}")
             else:
-                await member.remove_roles(role)
-                print(f"{member.name} no longer has the role {role.name}")
+                await member.remove_roles(*roles)
+                print(f"{member.name} no longer has the role {names}")
         except discord.Forbidden:
             print("Bot lacks permission to modify roles.")
         except discord.HTTPException as e:
@@ -88,48 +177,13 @@ class ReactionRole(commands.Cog):
         
         print(f"Emoji: {emoji}")  # Debugging
 
-        # Connect to the database
-        connection = sqlite3.connect("./servers_info/main.db")
-        cursor = connection.cursor()
-
-        # Ensure the table exists
-        cursor.execute(
-            """CREATE TABLE IF NOT EXISTS Reaction_Role (
-                message_id INTEGER NOT NULL,
-                reaction TEXT NOT NULL,
-                role_id INTEGER NOT NULL,
-                PRIMARY KEY (message_id, role_id, reaction)
-            )"""
-        )
-
         try:
-            # Check if the combination of message_id and role_id exists
-            cursor.execute(
-                "SELECT COUNT(*) FROM Reaction_Role WHERE message_id = ? AND role_id = ?",
-                (int(message_id), role.id)
-            )
-            result = cursor.fetchone()
-
-            if result[0] > 0:
-                # If entry exists, update the reaction for the role
-                cursor.execute(
-                    "UPDATE Reaction_Role SET reaction = ? WHERE message_id = ? AND role_id = ?",
-                    (emoji, int(message_id), role.id)
-                )
-            else:
-                # If no entry exists, insert a new one
-                cursor.execute(
-                    "INSERT INTO Reaction_Role (message_id, reaction, role_id) VALUES (?, ?, ?)",
-                    (int(message_id), emoji, role.id)
-                )
-            
-            connection.commit()
+            await self.client.db.run(_set_reaction_role, int(message_id), emoji, role.id)
         except sqlite3.Error as e:
             await interaction.response.send_message(f"Database error: {e}", ephemeral=True)
-            connection.close()
             return
 
-        connection.close()
+        self._index_set(int(message_id), emoji, role.id)
 
         await interaction.response.send_message(
             f"Reaction role set: Message ID `{message_id}`, Role `{role.name}`, Emoji `{emoji}`."
@@ -152,44 +206,23 @@ class ReactionRole(commands.Cog):
         
         print(f"Emoji: {emoji}")  # Debugging
 
-        # Connect to the database
-        connection = sqlite3.connect("./servers_info/main.db")
-        cursor = connection.cursor()
-
         try:
-            # Check if the combination of message_id, role_id, and emoji exists
-            cursor.execute(
-                "SELECT COUNT(*) FROM Reaction_Role WHERE message_id = ? AND role_id = ? AND reaction = ?",
-                (int(message_id), role.id, emoji)
-            )
-            result = cursor.fetchone()
-
-            if result[0] > 0:
-                # If the entry exists, delete it
-                cursor.execute(
-                    "DELETE FROM Reaction_Role WHERE message_id = ? AND role_id = ? AND reaction = ?",
-                    (int(message_id), role.id, emoji)
-                )
-                
-                # Commit the transaction before running VACUUM
-                connection.commit()
-
-                # Now run VACUUM to reclaim space
-                cursor.execute("VACUUM")
-
-                await interaction.response.send_message(
-                    f"Reaction role removed: Message ID `{message_id}`, Role `{role.name}`, Emoji `{emoji}`."
-                )
-            else:
-                # If no matching entry exists, inform the user
-                await interaction.response.send_message(
-                    f"No such reaction role found for Message ID `{message_id}`, Role `{role.name}`, Emoji `{emoji}`.",
-                    ephemeral=True
-                )
+            removed = await self.client.db.run(_remove_reaction_role, int(message_id), emoji, role.id)
         except sqlite3.Error as e:
             await interaction.response.send_message(f"Database error: {e}", ephemeral=True)
-        finally:
-            connection.close()
+            return
+
+        if removed:
+            self._index_remove(int(message_id), emoji, role.id)
+            await interaction.response.send_message(
+                f"Reaction role removed: Message ID `{message_id}`, Role `{role.name}`, Emoji `{emoji}`."
+            )
+        else:
+            # If no matching entry exists, inform the user
+            await interaction.response.send_message(
+                f"No such reaction role found for Message ID `{message_id}`, Role `{role.name}`, Emoji `{emoji}`.",
+                ephemeral=True
+            )
 
     # Error handling for permission-related errors
     @admin_set_reaction_role.error
@@ -0,0 +1,140 @@
+import logging
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands, tasks
+
+
+log = logging.getLogger(__name__)
+
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ("guilds",)
+
+SAMPLE_SECONDS = 10.0
+
+
+@dataclass
+class ShardHealth:
+    connects: int = 0
+    reconnects: int = 0
+    resumes: int = 0
+    disconnects: int = 0
+    events: int = 0
+    event_rate: float = 0.0
+    latency: float = math.nan
+    last_sequence: Optional[int] = None
+
+
+class ShardStats(commands.Cog):
+    """Per-shard gateway latency, event rate and reconnect counters."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.shards: Dict[int, ShardHealth] = {}
+        self.sample_shards.start()
+
+    def cog_unload(self):
+        self.sample_shards.cancel()
+
+    @property
+    def is_sharded(self) -> bool:
+        return isinstance(self.bot, discord.AutoShardedClient)
+
+    def health(self, shard_id: Optional[int]) -> ShardHealth:
+        shard_id = shard_id or 0
+        if shard_id not in self.shards:
+            self.shards[shard_id] = ShardHealth()
+        return self.shards[shard_id]
+
+    def _record_connect(self, shard_id: Optional[int]):
+        health = self.health(shard_id)
+        health.connects += 1
+        if health.connects > 1:
+            health.reconnects += 1
+            log.warning("Shard %s reconnected (%s reconnects)", shard_id or 0, health.reconnects)
+
+    # ---------- Gateway events ----------
+    @commands.Cog.listener()
+    async def on_shard_connect(self, shard_id: int):
+        self._record_connect(shard_id)
+
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shard_id: int):
+        self.health(shard_id).resumes += 1
+
+    @commands.Cog.listener()
+    async def on_shard_disconnect(self, shard_id: int):
+        self.health(shard_id).disconnects += 1
+
+    # A plain Bot only dispatches the shard-less versions
+    @commands.Cog.listener()
+    async def on_connect(self):
+        if not self.is_sharded:
+            self._record_connect(0)
+
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        if not self.is_sharded:
+            self.health(0).resumes += 1
+
+    @commands.Cog.listener()
+    async def on_disconnect(self):
+        if not self.is_sharded:
+            self.health(0).disconnects += 1
+
+    # ---------- Sampling ----------
+    def _websockets(self) -> List[Tuple[int, object, float]]:
+        """(shard_id, gateway websocket, latency) for every shard in this process."""
+        if not self.is_sharded:
+            return [(0, getattr(self.bot, "ws", None), self.bot.latency)]
+
+        result = []
+        for shard_id, info in self.bot.shards.items():
+            # ShardInfo wraps the Shard that owns the websocket
+            ws = getattr(getattr(info, "_parent", None), "ws", None)
+            result.append((shard_id, ws, info.latency))
+        return result
+
+    @tasks.loop(seconds=SAMPLE_SECONDS)
+    async def sample_shards(self):
+        for shard_id, ws, latency in self._websockets():
+            health = self.health(shard_id)
+            health.latency = latency
+
+            # The gateway sequence number goes up by one per dispatched event
+            sequence = getattr(ws, "sequence", None)
+            if sequence is None:
+                continue
+            if health.last_sequence is None or sequence < health.last_sequence:
+                # First sample, or a new gateway session restarted the count
+                delta = sequence if health.last_sequence is not None else 0
+            else:
+                delta = sequence - health.last_sequence
+            health.last_sequence = sequence
+            health.events += delta
+            health.event_rate = delta / SAMPLE_SECONDS
+
+    @sample_shards.before_loop
+    async def before_sample_shards(self):
+        await self.bot.wait_until_ready()
+
+    # ---------- Commands ----------
+    @commands.command(help="Show per-shard gateway health.")
+    @commands.is_owner()
+    async def shards(self, ctx: commands.Context):
+        config = getattr(self.bot, "shard_config", None)
+        lines = [f"mode: {config.describe() if config else 'single connection'}"]
+        for shard_id, health in sorted(self.shards.items()):
+            latency_ms = "n/a" if math.isnan(health.latency) else f"{health.latency * 1000:.0f}ms"
+            lines.append(
+                f"shard {shard_id}: latency={latency_ms} events/s={health.event_rate:.1f} "
+                f"events={health.events} reconnects={health.reconnects} "
+                f"resumes={health.resumes} disconnects={health.disconnects}"
+            )
+        await ctx.send("```yaml\n" + "\n".join(lines) + "\n```")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(ShardStats(bot))
@@ -1,6 +1,9 @@
 import discord
 from discord.ext import commands
 
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ("guild_messages", "message_content")
+
 class Test(commands.Cog):
     def __init__(self, client):
         self.client = client
@@ -0,0 +1,75 @@
+import io
+import logging
+import os
+
+import discord
+from discord.ext import commands
+
+from loop_watchdog import LoopWatchdog
+
+
+log = logging.getLogger(__name__)
+
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+# 0 turns the watchdog off
+STALL_THRESHOLD_SECONDS = _env_float("LOOP_STALL_THRESHOLD_SECONDS", 0.5)
+STALL_HISTORY = _env_int("LOOP_STALL_HISTORY", 50)
+
+
+class Watchdog(commands.Cog):
+    """Event loop stall detector (see loop_watchdog.py) and its dump command."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.watchdog = LoopWatchdog(STALL_THRESHOLD_SECONDS, STALL_HISTORY)
+
+    async def cog_load(self):
+        if STALL_THRESHOLD_SECONDS <= 0:
+            log.info("Loop watchdog disabled (LOOP_STALL_THRESHOLD_SECONDS=0)")
+            return
+        self.watchdog.start()
+
+    def cog_unload(self):
+        self.watchdog.stop()
+
+    @commands.command(help="Show recent event loop stalls and what caused them.")
+    @commands.is_owner()
+    async def stalls(self, ctx: commands.Context, count: int = 10):
+        watchdog = self.watchdog
+        reports = watchdog.recent(max(count, 1))
+        header = (
+            f"threshold: {watchdog.threshold * 1000:.0f}ms\n"
+            f"stalls: {watchdog.stalls} ({watchdog.stalled_seconds:.1f}s total)\n"
+        )
+        if not reports:
+            await ctx.send(f"```yaml\n{header}```")
+            return
+
+        summary = "\n".join(f"- {report.describe()}" for report in reports)
+        # Full stacks go in an attachment; they never fit in one message
+        dump = "\n\n".join(f"{report.describe()}\n{report.stack}" for report in reports)
+        await ctx.send(
+            f"```yaml\n{header}{summary[:1800]}\n```",
+            file=discord.File(io.BytesIO(dump.encode("utf-8")), filename="stalls.txt"),
+        )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Watchdog(bot))
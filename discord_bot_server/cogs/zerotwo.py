@@ -1,28 +1,53 @@
 import os
-import aiohttp
 import discord
 from discord.ext import commands
 
+from backend_gate import BackendBusy
+from circuit_breaker import CircuitOpen
+from webhook_outbox import VoiceStateOutbox
+
+# Gateway intents this cog needs (read by intents_profile.py)
+REQUIRED_INTENTS = ("guild_messages", "message_content", "voice_states")
+
 # Config via env (override these if you want)
 N8N_ZERO_TWO_WEBHOOK   = os.getenv("N8N_ZERO_TWO_WEBHOOK", "http://10.22.22.111:5678/webhook/zero-two")
 N8N_VOICE_STATE_WEBHOOK = os.getenv("N8N_VOICE_STATE_WEBHOOK", "http://10.22.22.111:5678/webhook/zero-two-voice")
 
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+# Voice-state outbox (see webhook_outbox.py); batch size 1 keeps the one-object body n8n expects
+N8N_VOICE_STATE_BATCH_SIZE = int(_env_float("N8N_VOICE_STATE_BATCH_SIZE", 1))
+N8N_VOICE_STATE_RETRY_MAX_SECONDS = _env_float("N8N_VOICE_STATE_RETRY_MAX_SECONDS", 300.0)
+
 class ZeroTwoCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.http = None  # lazy-created aiohttp session
         # cache of the bot's own VC state per guild (kept fresh by on_voice_state_update)
+        # only connected guilds are kept; the rest fall back to guild.me.voice
         self.voice_state = {}  # { guild_id: {"connected": bool, "channel_id": str|None} }
+        self.voice_state_reclaimed = 0
+        self.voice_outbox = VoiceStateOutbox(
+            bot.db,
+            bot.http_client,
+            N8N_VOICE_STATE_WEBHOOK,
+            batch_size=N8N_VOICE_STATE_BATCH_SIZE,
+            retry_max=N8N_VOICE_STATE_RETRY_MAX_SECONDS,
+        )
 
-    async def _session(self) -> aiohttp.ClientSession:
-        if self.http is None or self.http.closed:
-            self.http = aiohttp.ClientSession()
-        return self.http
+    async def cog_load(self):
+        # Arisu.on_message calls ask_zero_two on mentions through this reference
+        self.bot.zero_two = self
+        await self.voice_outbox.start()
 
-    def cog_unload(self):
-        # close http session on unload
-        if self.http and not self.http.closed:
-            self.bot.loop.create_task(self.http.close())
+    async def cog_unload(self):
+        if getattr(self.bot, "zero_two", None) is self:
+            self.bot.zero_two = None
+        # Undelivered states stay in the database for the next run
+        await self.voice_outbox.stop()
 
     def _is_connected(self, guild: discord.Guild):
         """Return (connected_bool, channel_id_str_or_None). Uses cache; falls back to guild.me.voice."""
@@ -43,18 +68,21 @@ class ZeroTwoCog(commands.Cog):
 
         connected = after.channel is not None
         channel_id = str(after.channel.id) if after.channel else None
-        self.voice_state[member.guild.id] = {"connected": connected, "channel_id": channel_id}
+        if connected:
+            self.voice_state[member.guild.id] = {"connected": connected, "channel_id": channel_id}
+        elif self.voice_state.pop(member.guild.id, None) is not None:
+            self.voice_state_reclaimed += 1
 
-        # best-effort webhook to n8n so it can persist state (Data Store/Postgres)
+        # tell n8n so it can persist state (Data Store/Postgres); the outbox retries until it gets through
         try:
-            s = await self._session()
-            await s.post(
-                N8N_VOICE_STATE_WEBHOOK,
-                json={"guild_id": str(member.guild.id), "channel_id": channel_id, "connected": connected},
-                timeout=5
-            )
+            await self.voice_outbox.put(member.guild.id, channel_id, connected)
         except Exception as e:
-            print(f"[voice-state] notify failed: {e}")
+            print(f"[voice-state] queue failed: {e}")
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        if self.voice_state.pop(guild.id, None) is not None:
+            self.voice_state_reclaimed += 1
 
     # --- Your existing command, now VC-aware and non-blocking ---
     @commands.command(name="ask")
@@ -62,6 +90,8 @@ class ZeroTwoCog(commands.Cog):
         """Ask Zero Two by triggering n8n. n8n handles Discord replies directly."""
         guild_id = str(ctx.guild.id) if ctx.guild else "DM"
         connected, bot_channel_id = self._is_connected(ctx.guild)
+        # Earlier messages and the replied-to message come from the gateway buffer, not REST
+        context = self.bot.conversations.context_for(ctx.message, self.bot.user.id if self.bot.user else None)
 
         payload = {
             "source": "discord",
@@ -71,6 +101,8 @@ class ZeroTwoCog(commands.Cog):
             "channel_id": str(ctx.channel.id),
             "message_id": str(ctx.message.id),
             "guild_id": guild_id,
+            "history": context["history"],
+            "reply_to": context["reply_to"],
 
             # Let n8n branch: speak only if the bot is already connected in this guild
             "speak": connected,
@@ -82,19 +114,30 @@ class ZeroTwoCog(commands.Cog):
         }
 
         try:
-            s = await self._session()
-            async with s.post(N8N_ZERO_TWO_WEBHOOK, json=payload, timeout=20) as r:
-                if r.status < 200 or r.status >= 300:
-                    err_text = await r.text()
-                    err_text = err_text.strip()
-                    if len(err_text) > 500:
-                        err_text = err_text[:500] + "..."
-                    raise RuntimeError(f"n8n request failed ({r.status}): {err_text or '<empty body>'}")
-                # n8n is configured as noData/lastNode and posts to Discord itself.
-                # Do not parse response content or send a second Discord reply here.
+            # Bounded concurrency with a fair per-user queue; shed callers get a quick "busy" reply
+            await self.bot.backend_gates["n8n"].run(lambda: self._post_ask(payload), user_id=ctx.author.id)
+        except BackendBusy as e:
+            print(f"[ask] {e}")
+            await ctx.reply("Zero Two is busy right now, try again in a moment.", mention_author=False)
+        except CircuitOpen as e:
+            print(f"[ask] {e}")
+            await ctx.reply("Zero Two can't be reached right now, try again in a little while.", mention_author=False)
         except Exception as e:
             print(f"[ask] {e}")
 
+    async def _post_ask(self, payload: dict):
+        async with self.bot.http_client.request(
+            "n8n_zero_two", "POST", N8N_ZERO_TWO_WEBHOOK, json=payload, timeout=self.bot.http_client.generation_timeout_for("n8n_zero_two", 20)
+        ) as r:
+            if r.status < 200 or r.status >= 300:
+                err_text = await r.text()
+                err_text = err_text.strip()
+                if len(err_text) > 500:
+                    err_text = err_text[:500] + "..."
+                raise RuntimeError(f"n8n request failed ({r.status}): {err_text or '<empty body>'}")
+            # n8n is configured as noData/lastNode and posts to Discord itself.
+            # Do not parse response content or send a second Discord reply here.
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(ZeroTwoCog(bot))
 
@@ -0,0 +1,178 @@
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+class BufferedMessage:
+    """The few fields of a gateway message that go into a backend payload."""
+
+    __slots__ = ("id", "author_id", "author", "is_bot", "content", "created_at", "reply_to", "stored_at")
+
+    def __init__(self, message: Any, max_chars: int, stored_at: float):
+        reference = getattr(message, "reference", None)
+        self.id: int = message.id
+        self.author_id: int = message.author.id
+        self.author = str(message.author)
+        self.is_bot = bool(getattr(message.author, "bot", False))
+        self.content: str = (message.content or "")[:max_chars]
+        self.created_at = message.created_at
+        self.reply_to: Optional[int] = getattr(reference, "message_id", None)
+        self.stored_at = stored_at
+
+    def to_payload(self) -> Dict[str, Any]:
+        return {
+            "message_id": str(self.id),
+            "author_id": str(self.author_id),
+            "author": self.author,
+            "is_bot": self.is_bot,
+            "content": self.content,
+            "timestamp": self.created_at.isoformat() if self.created_at else None,
+            "reply_to_message_id": str(self.reply_to) if self.reply_to else None,
+        }
+
+
+class ConversationBuffer:
+    """Recent messages per channel, kept from gateway events so payloads need no REST history fetch.
+
+    Memory is bounded three ways: at most ``per_channel`` messages per channel,
+    at most ``max_channels`` channels (least recently active dropped first) and
+    at most ``max_chars`` characters of content per message. Messages older than
+    ``ttl`` seconds are dropped when their channel is read or swept.
+    """
+
+    def __init__(
+        self,
+        max_channels: int = 500,
+        per_channel: int = 20,
+        ttl: float = 1800.0,
+        max_chars: int = 500,
+        history_limit: int = 8,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_channels = max(int(max_channels), 0)
+        self.per_channel = max(int(per_channel), 0)
+        self.ttl = float(ttl)
+        self.max_chars = max(int(max_chars), 0)
+        self.history_limit = max(int(history_limit), 0)
+        self.clock = clock
+        self.evicted = 0
+        self._channels: "OrderedDict[int, Deque[BufferedMessage]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_channels > 0 and self.per_channel > 0
+
+    def __len__(self) -> int:
+        return sum(len(messages) for messages in self._channels.values())
+
+    @property
+    def channels(self) -> int:
+        return len(self._channels)
+
+    def add(self, message: Any) -> None:
+        if not self.enabled:
+            return
+        channel_id = message.channel.id
+        messages = self._channels.get(channel_id)
+        if messages is None:
+            messages = self._channels[channel_id] = deque(maxlen=self.per_channel)
+            while len(self._channels) > self.max_channels:
+                _, dropped = self._channels.popitem(last=False)
+                self.evicted += len(dropped)
+        else:
+            self._channels.move_to_end(channel_id)
+        messages.append(BufferedMessage(message, self.max_chars, self.clock()))
+
+    def find(self, channel_id: int, message_id: int) -> Optional[BufferedMessage]:
+        for entry in self._channels.get(channel_id, ()):
+            if entry.id == message_id:
+                return entry
+        return None
+
+    def edit(self, channel_id: int, message_id: int, content: str) -> None:
+        entry = self.find(channel_id, message_id)
+        if entry is not None:
+            entry.content = content[: self.max_chars]
+
+    def delete(self, channel_id: int, message_id: int) -> None:
+        entry = self.find(channel_id, message_id)
+        if entry is not None:
+            self._channels[channel_id].remove(entry)
+
+    def forget_channel(self, channel_id: int) -> None:
+        dropped = self._channels.pop(channel_id, None)
+        if dropped:
+            self.evicted += len(dropped)
+
+    def _live(self, channel_id: int) -> Deque[BufferedMessage]:
+        """The channel's messages with expired ones dropped from the front."""
+        messages = self._channels.get(channel_id)
+        if messages is None:
+            return deque()
+        cutoff = self.clock() - self.ttl
+        while messages and messages[0].stored_at <= cutoff:
+            messages.popleft()
+            self.evicted += 1
+        if not messages:
+            del self._channels[channel_id]
+        return messages
+
+    def sweep(self) -> int:
+        """Drop expired messages in every channel; returns how many were dropped."""
+        before = self.evicted
+        for channel_id in list(self._channels):
+            self._live(channel_id)
+        return self.evicted - before
+
+    def history(self, message: Any, bot_id: Optional[int], limit: int) -> List[Dict[str, Any]]:
+        """Up to ``limit`` earlier messages in the channel from the same author or the bot, oldest first."""
+        if limit <= 0:
+            return []
+        wanted = {message.author.id, bot_id}
+        picked = []
+        for entry in reversed(self._live(message.channel.id)):
+            if entry.id < message.id and entry.author_id in wanted:
+                picked.append(entry.to_payload())
+                if len(picked) >= limit:
+                    break
+        picked.reverse()
+        return picked
+
+    def reply_to(self, message: Any) -> Optional[Dict[str, Any]]:
+        """The message being replied to, from the buffer or the copy the gateway sent along."""
+        reference = getattr(message, "reference", None)
+        message_id = getattr(reference, "message_id", None)
+        if message_id is None:
+            return None
+        channel_id = getattr(reference, "channel_id", None) or message.channel.id
+        entry = self.find(channel_id, message_id)
+        if entry is None:
+            resolved = getattr(reference, "resolved", None)
+            if getattr(resolved, "author", None) is not None and getattr(resolved, "content", None) is not None:
+                entry = BufferedMessage(resolved, self.max_chars, self.clock())
+        if entry is None:
+            return {"message_id": str(message_id)}
+        return entry.to_payload()
+
+    def context_for(self, message: Any, bot_id: Optional[int]) -> Dict[str, Any]:
+        """The ``history`` and ``reply_to`` fields added to ZeroTwo and LangGraph payloads."""
+        return {"history": self.history(message, bot_id, self.history_limit), "reply_to": self.reply_to(message)}
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+def load_conversation_buffer() -> ConversationBuffer:
+    """Buffer configured from ``CONVERSATION_*`` environment variables."""
+    return ConversationBuffer(
+        max_channels=int(_env_number("CONVERSATION_MAX_CHANNELS", 500)),
+        per_channel=int(_env_number("CONVERSATION_MESSAGES_PER_CHANNEL", 20)),
+        ttl=_env_number("CONVERSATION_TTL_MINUTES", 30) * 60,
+        max_chars=int(_env_number("CONVERSATION_MAX_CHARS", 500)),
+        history_limit=int(_env_number("CONVERSATION_HISTORY_LIMIT", 8)),
+    )
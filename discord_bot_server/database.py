@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, TypeVar
+
+from metrics import Histogram
+
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_DB_PATH = "./servers_info/main.db"
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS Guilds (guild_id INTEGER PRIMARY KEY)",
+    "CREATE TABLE IF NOT EXISTS Bot_State (key TEXT PRIMARY KEY, value TEXT)",
+    """CREATE TABLE IF NOT EXISTS Auto_role (
+        guild_id INTEGER PRIMARY KEY,
+        auto_role_id INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS Reaction_Role (
+        message_id INTEGER NOT NULL,
+        reaction TEXT NOT NULL,
+        role_id INTEGER NOT NULL,
+        PRIMARY KEY (message_id, role_id, reaction)
+    )""",
+    """CREATE TABLE IF NOT EXISTS Music_Session (
+        guild_id INTEGER PRIMARY KEY,
+        channel_id INTEGER NOT NULL,
+        track TEXT,
+        position_ms INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS Music_Queue (
+        guild_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        track TEXT NOT NULL,
+        PRIMARY KEY (guild_id, seq)
+    )""",
+    # Guilds that turned off the LangGraph reply cache (see cogs/langgraph_test.py)
+    "CREATE TABLE IF NOT EXISTS Reply_Cache_Optout (guild_id INTEGER PRIMARY KEY)",
+    # Latest undelivered n8n voice state per guild (see webhook_outbox.py)
+    """CREATE TABLE IF NOT EXISTS Voice_State_Outbox (
+        guild_id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        channel_id TEXT,
+        connected INTEGER NOT NULL,
+        queued_at REAL NOT NULL
+    )""",
+)
+
+
+def get_db_path() -> str:
+    return os.getenv("ARISU_DB_PATH", DEFAULT_DB_PATH).strip() or DEFAULT_DB_PATH
+
+
+class Database:
+    """One shared SQLite connection owned by a dedicated worker thread.
+
+    Every query is handed to that thread, so disk I/O and lock waits never run
+    on the event loop. The connection is opened in WAL mode and keeps a cache of
+    prepared statements, so always pass values as parameters.
+    """
+
+    def __init__(self, path: Optional[str] = None, statement_cache_size: int = 128):
+        self.path = path or get_db_path()
+        self.statement_cache_size = statement_cache_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        # Time from submitting a query to getting its result, including the wait for the thread
+        self.query_seconds = Histogram(
+            "arisu_sqlite_query_seconds",
+            "SQLite call duration, including time queued for the database thread.",
+            ("operation",),
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+        )
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(
+            self.path,
+            timeout=5.0,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        return conn
+
+    async def connect(self) -> None:
+        if self._conn is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="arisu-db")
+        loop = asyncio.get_running_loop()
+        self._conn = await loop.run_in_executor(self._executor, self._open)
+        log.info("Database ready at %s (WAL)", self.path)
+
+    async def close(self) -> None:
+        if self._conn is None or self._executor is None:
+            return
+        conn, executor = self._conn, self._executor
+        self._conn = None
+        self._executor = None
+
+        def _close():
+            try:
+                conn.execute("PRAGMA optimize")
+            finally:
+                conn.close()
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(executor, _close)
+        finally:
+            executor.shutdown(wait=True)
+        log.info("Database closed")
+
+    async def run(self, fn: Callable[..., T], *args: Any, operation: Optional[str] = None) -> T:
+        """Run ``fn(connection, *args)`` on the database thread as one transaction.
+
+        Timings are recorded under ``operation``, or the function's name.
+        """
+        if self._conn is None or self._executor is None:
+            raise RuntimeError("Database is not connected")
+        conn = self._conn
+
+        def _call():
+            try:
+                result = fn(conn, *args)
+                conn.commit()
+                return result
+            except BaseException:
+                conn.rollback()
+                raise
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, _call)
+        finally:
+            self.query_seconds.observe(time.perf_counter() - started, operation or getattr(fn, "__name__", "run"))
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Execute a write statement and commit it. Returns the affected row count."""
+        return await self.run(lambda conn: conn.execute(sql, params).rowcount, operation="execute")
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone(), operation="fetchone")
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall(), operation="fetchall")
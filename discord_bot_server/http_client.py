@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Optional
+
+import aiohttp
+
+from circuit_breaker import CircuitBreaker, adaptive_timeout
+
+log = logging.getLogger(__name__)
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+@dataclass(frozen=True)
+class HttpClientConfig:
+    limit: int = 100
+    limit_per_host: int = 20
+    dns_cache_seconds: int = 300
+    keepalive_seconds: float = 30.0
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 30.0
+    timeout_percentile: float = 99.0
+    timeout_multiplier: float = 3.0
+    timeout_min_seconds: float = 5.0
+    timeout_min_samples: int = 20
+
+    @classmethod
+    def from_env(cls) -> "HttpClientConfig":
+        return cls(
+            limit=int(_env_number("HTTP_POOL_LIMIT", cls.limit)),
+            limit_per_host=int(_env_number("HTTP_POOL_LIMIT_PER_HOST", cls.limit_per_host)),
+            dns_cache_seconds=int(_env_number("HTTP_DNS_CACHE_SECONDS", cls.dns_cache_seconds)),
+            keepalive_seconds=_env_number("HTTP_KEEPALIVE_SECONDS", cls.keepalive_seconds),
+            breaker_failures=int(_env_number("HTTP_BREAKER_FAILURES", cls.breaker_failures)),
+            breaker_reset_seconds=_env_number("HTTP_BREAKER_RESET_SECONDS", cls.breaker_reset_seconds),
+            timeout_percentile=_env_number("HTTP_TIMEOUT_PERCENTILE", cls.timeout_percentile),
+            timeout_multiplier=_env_number("HTTP_TIMEOUT_MULTIPLIER", cls.timeout_multiplier),
+            timeout_min_seconds=_env_number("HTTP_TIMEOUT_MIN_SECONDS", cls.timeout_min_seconds),
+            timeout_min_samples=int(_env_number("HTTP_TIMEOUT_MIN_SAMPLES", cls.timeout_min_samples)),
+        )
+
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=200))
+    # Time until the response headers arrived, for streamed replies whose total length varies
+    first_byte: Deque[float] = field(default_factory=lambda: deque(maxlen=200))
+
+    def record(self, seconds: float, error: bool) -> None:
+        self.requests += 1
+        if error:
+            self.errors += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.recent.append(seconds)
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.requests if self.requests else 0.0
+
+    def percentile(self, pct: float, samples: Optional[Deque[float]] = None) -> float:
+        """Latency percentile (0-100) over the most recent requests (or ``samples``)."""
+        samples = self.recent if samples is None else samples
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+
+class HttpClient:
+    """Bot-wide aiohttp session with a tuned connection pool and per-endpoint counters.
+
+    Every cog shares this one session, so connections (and TLS handshakes) to the
+    n8n and LangGraph hosts are reused across commands instead of per cog. Each
+    endpoint also gets a circuit breaker, and ``timeout_for`` /
+    ``generation_timeout_for`` shorten its timeouts to a multiple of the latency
+    it actually shows.
+    """
+
+    def __init__(self, config: Optional[HttpClientConfig] = None):
+        self.config = config or HttpClientConfig.from_env()
+        self.stats: Dict[str, EndpointStats] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # endpoint -> the adaptive timeout last handed out, for summary() and /metrics
+        self.timeouts: Dict[str, float] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            async with self._lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=self.config.limit,
+                        limit_per_host=self.config.limit_per_host,
+                        ttl_dns_cache=self.config.dns_cache_seconds,
+                        keepalive_timeout=self.config.keepalive_seconds,
+                    )
+                    self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats_for(self, endpoint: str) -> EndpointStats:
+        stats = self.stats.get(endpoint)
+        if stats is None:
+            stats = self.stats[endpoint] = EndpointStats()
+        return stats
+
+    def breaker_for(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(
+                endpoint, self.config.breaker_failures, self.config.breaker_reset_seconds
+            )
+        return breaker
+
+    def timeout_seconds(self, endpoint: str, ceiling: float, first_byte: bool = False) -> float:
+        """``ceiling`` until the endpoint has enough samples, then a multiple of its latency percentile.
+
+        With ``first_byte`` the percentile is of time to the response headers
+        rather than of the whole request.
+        """
+        stats = self.stats.get(endpoint)
+        if stats is None:
+            return ceiling
+        samples = stats.first_byte if first_byte else stats.recent
+        adaptive = adaptive_timeout(
+            len(samples),
+            stats.percentile(self.config.timeout_percentile, samples),
+            ceiling,
+            multiplier=self.config.timeout_multiplier,
+            floor=self.config.timeout_min_seconds,
+            min_samples=self.config.timeout_min_samples,
+        )
+        return ceiling if adaptive is None else adaptive
+
+    def timeout_for(self, endpoint: str, ceiling: float) -> aiohttp.ClientTimeout:
+        """Total timeout for quick calls (webhooks) whose duration says how healthy the backend is."""
+        seconds = self.timeouts[endpoint] = self.timeout_seconds(endpoint, ceiling)
+        return aiohttp.ClientTimeout(total=seconds)
+
+    def generation_timeout_for(self, endpoint: str, ceiling: float, stream: bool = False) -> aiohttp.ClientTimeout:
+        """Timeouts for calls that take as long as the backend generates (LangGraph, n8n asks).
+
+        A long answer is not a sick backend, so the total is never shortened:
+        it stays at ``ceiling``, or unbounded when streaming. Connecting is
+        bounded by HTTP_TIMEOUT_MIN_SECONDS. A stream's wait for its first byte
+        and for each later chunk adapts to the endpoint's time to first byte.
+        """
+        connect = min(self.config.timeout_min_seconds, ceiling)
+        if not stream:
+            self.timeouts[endpoint] = ceiling
+            return aiohttp.ClientTimeout(total=ceiling, sock_connect=connect)
+        read = self.timeouts[endpoint] = self.timeout_seconds(endpoint, ceiling, first_byte=True)
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+    @asynccontextmanager
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        """``session.request`` that records latency and errors under ``endpoint``.
+
+        Raises :class:`circuit_breaker.CircuitOpen` without sending anything while
+        the endpoint's breaker is open. The breaker is settled by the response
+        status before the caller sees it: HTTP 5xx is a failure, anything else
+        (4xx included) means the backend is up. After that only transport errors
+        and timeouts while reading count; errors raised by the caller's own code
+        do not.
+        """
+        session = await self.session()
+        stats = self.stats_for(endpoint)
+        breaker = self.breaker_for(endpoint)
+        breaker.before_call()
+        started = time.perf_counter()
+        settled = False
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                stats.first_byte.append(time.perf_counter() - started)
+                if response.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                settled = True
+                yield response
+        except asyncio.CancelledError:
+            if not settled:
+                breaker.abandon()
+            raise
+        except Exception as e:
+            stats.record(time.perf_counter() - started, error=True)
+            if not settled or isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                breaker.record_failure()
+            raise
+        else:
+            stats.record(time.perf_counter() - started, error=response.status >= 400)
+
+    def summary(self) -> str:
+        lines = []
+        for endpoint, stats in sorted(self.stats.items()):
+            line = (
+                f"{endpoint}: requests={stats.requests} errors={stats.errors} "
+                f"mean={stats.mean_seconds * 1000:.0f}ms p95={stats.percentile(95) * 1000:.0f}ms "
+                f"max={stats.max_seconds * 1000:.0f}ms circuit={self.breaker_for(endpoint).describe()}"
+            )
+            if endpoint in self.timeouts:
+                line += f" timeout={self.timeouts[endpoint]:.1f}s"
+            lines.append(line)
+        return "\n".join(lines) or "no requests yet"
@@ -0,0 +1,234 @@
+import ast
+import asyncio
+import json
+import logging
+import os
+import resource
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+import discord
+
+
+log = logging.getLogger(__name__)
+
+# What Arisu.py itself needs: guild join/leave, prefix commands and mentions (in servers and DMs), voice for Mafic
+CORE_INTENTS = ("guilds", "guild_messages", "dm_messages", "message_content", "voice_states")
+
+INTENT_PROFILES = ("all", "minimal")
+
+# Bot_State key holding the footprint measured at the last startup under each profile
+SNAPSHOT_KEY = "memory_snapshot:{}"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+def declared_intents(cogs_dir: str) -> Set[str]:
+    """Union of the ``REQUIRED_INTENTS`` tuples declared at the top of each cog.
+
+    The files are parsed, not imported, so this can run before the bot exists.
+    """
+    names: Set[str] = set()
+    for filename in sorted(os.listdir(cogs_dir)):
+        if not filename.endswith(".py"):
+            continue
+        path = os.path.join(cogs_dir, filename)
+        try:
+            with open(path, encoding="utf-8") as source:
+                tree = ast.parse(source.read(), filename=path)
+        except (OSError, SyntaxError) as exc:
+            log.error("Could not read intents from %s: %s", filename, exc)
+            continue
+
+        for node in tree.body:
+            if not isinstance(node, ast.Assign):
+                continue
+            if not any(isinstance(target, ast.Name) and target.id == "REQUIRED_INTENTS" for target in node.targets):
+                continue
+            try:
+                names.update(ast.literal_eval(node.value))
+            except ValueError:
+                log.error("REQUIRED_INTENTS in %s must be a literal tuple of names", filename)
+    return names
+
+
+def _intents_from_names(names: Iterable[str]) -> discord.Intents:
+    intents = discord.Intents.none()
+    for name in names:
+        if name not in discord.Intents.VALID_FLAGS:
+            log.error("Unknown intent %r, ignoring it", name)
+            continue
+        setattr(intents, name, True)
+    return intents
+
+
+def intents_profile(profile: Optional[str] = None) -> str:
+    """``profile`` or BOT_INTENTS_PROFILE, normalised; anything unknown means ``all``."""
+    profile = (profile or os.getenv("BOT_INTENTS_PROFILE", "all")).strip().lower()
+    return profile if profile in INTENT_PROFILES else "all"
+
+
+def build_client_options(cogs_dir: str, profile: Optional[str] = None) -> dict:
+    """Intents and cache settings for ``commands.Bot``.
+
+    ``BOT_INTENTS_PROFILE=all`` keeps the old behaviour (every intent, full caches).
+    ``minimal`` only asks for what Arisu.py and the cogs declare, plus
+    ``BOT_EXTRA_INTENTS``, caches just the members it sees join or sit in voice,
+    never chunks guilds at startup and keeps a small message cache.
+    """
+    requested = (profile or os.getenv("BOT_INTENTS_PROFILE", "all")).strip().lower()
+    profile = intents_profile(requested)
+    if profile != requested:
+        log.error("Unknown BOT_INTENTS_PROFILE %r, using 'all'", requested)
+
+    if profile != "minimal":
+        return {
+            "intents": discord.Intents.all(),
+            "max_messages": _env_int("BOT_MAX_MESSAGES", 1000) or None,
+        }
+
+    extra = [name.strip() for name in os.getenv("BOT_EXTRA_INTENTS", "").split(",") if name.strip()]
+    names = set(CORE_INTENTS) | declared_intents(cogs_dir) | set(extra)
+    intents = _intents_from_names(names)
+    log.info("Minimal intents profile: %s", ", ".join(sorted(names)))
+
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.from_intents(intents),
+        "chunk_guilds_at_startup": False,
+        "max_messages": _env_int("BOT_MAX_MESSAGES", 100) or None,
+    }
+
+
+def _rss_megabytes() -> float:
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak RSS: kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def member_for(bot: discord.Client, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+    """The member from the cache, else fetched on demand.
+
+    The minimal profile never chunks guilds, so a member who has not joined or
+    sat in voice since startup is not cached. With the members intent the
+    lookup goes over the gateway and caches the result; without it, over REST.
+    """
+    member = guild.get_member(user_id)
+    if member is not None:
+        return member
+    try:
+        if bot.intents.members:
+            found = await guild.query_members(user_ids=[user_id], limit=1, cache=True)
+            return found[0] if found else None
+        return await guild.fetch_member(user_id)
+    except (discord.NotFound, asyncio.TimeoutError):
+        return None
+
+
+def memory_snapshot(bot: discord.Client, profile: Optional[str] = None) -> Dict[str, Any]:
+    """The numbers !memory compares: RSS, cached members and messages."""
+    return {
+        "profile": intents_profile(profile),
+        "taken_at": int(time.time()),
+        "rss_mb": round(_rss_megabytes(), 1),
+        "guilds": len(bot.guilds),
+        "members_cached": sum(len(g.members) for g in bot.guilds),
+        "members_total": sum(g.member_count or 0 for g in bot.guilds),
+        "messages_cached": len(bot.cached_messages),
+    }
+
+
+async def record_memory_baseline(bot: discord.Client, db) -> Dict[str, Any]:
+    """Snapshot the footprint once the caches are filled at startup, kept per profile across restarts.
+
+    The snapshot stored under the other profile is the "before" that !memory
+    compares against, e.g. the last ``all`` run after switching to ``minimal``.
+    """
+    snapshot = memory_snapshot(bot)
+    bot.memory_baseline = snapshot
+    await db.execute(
+        "INSERT OR REPLACE INTO Bot_State (key, value) VALUES (?, ?)",
+        (SNAPSHOT_KEY.format(snapshot["profile"]), json.dumps(snapshot)),
+    )
+    log.info("Memory baseline (%s): %s MB RSS, %s members cached", snapshot["profile"], snapshot["rss_mb"], snapshot["members_cached"])
+    return snapshot
+
+
+async def load_memory_baselines(db) -> Dict[str, Dict[str, Any]]:
+    """profile -> the snapshot taken at the last startup under it."""
+    baselines = {}
+    for profile in INTENT_PROFILES:
+        row = await db.fetchone("SELECT value FROM Bot_State WHERE key = ?", (SNAPSHOT_KEY.format(profile),))
+        if row and row[0]:
+            try:
+                baselines[profile] = json.loads(row[0])
+            except ValueError:
+                log.error("Ignoring unreadable memory snapshot for profile %s", profile)
+    return baselines
+
+
+def _describe_snapshot(snapshot: Dict[str, Any]) -> str:
+    taken = time.strftime("%Y-%m-%d %H:%M", time.localtime(snapshot.get("taken_at", 0)))
+    return (
+        f"rss_mb={snapshot.get('rss_mb', 0)} members_cached={snapshot.get('members_cached', 0)}"
+        f" of {snapshot.get('members_total', 0)} messages_cached={snapshot.get('messages_cached', 0)} ({taken})"
+    )
+
+
+def memory_report(
+    bot: discord.Client,
+    top: int = 10,
+    profile: Optional[str] = None,
+    baselines: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> str:
+    """Cached vs. full member counts per guild, message cache usage and process RSS.
+
+    With ``baselines`` (see :func:`load_memory_baselines`) it also shows the
+    footprint at this run's startup and at the last startup under each
+    profile, with the change from the other profile to this one.
+    """
+    profile = intents_profile(profile)
+    guilds = sorted(bot.guilds, key=lambda g: g.member_count or 0, reverse=True)
+    total_members = sum(g.member_count or 0 for g in guilds)
+    cached_members = sum(len(g.members) for g in guilds)
+    max_messages = getattr(bot._connection, "max_messages", None)
+    rss = _rss_megabytes()
+
+    lines = [
+        f"profile: {profile}",
+        f"intents: {bot.intents.value}",
+        f"rss_mb: {rss:.1f}",
+        f"guilds: {len(guilds)}",
+        f"members_cached: {cached_members} of {total_members}"
+        + (" (full cache)" if profile == "all" else " (members seen joining, in voice or looked up)"),
+        f"messages_cached: {len(bot.cached_messages)} / {max_messages or 'disabled'}",
+    ]
+
+    startup = getattr(bot, "memory_baseline", None)
+    if startup:
+        lines.append(f"at_startup: {_describe_snapshot(startup)}")
+        lines.append(f"since_startup: rss_mb {rss - startup['rss_mb']:+.1f}, members_cached {cached_members - startup['members_cached']:+d}")
+    for other, snapshot in sorted((baselines or {}).items()):
+        lines.append(f"last_{other}_startup: {_describe_snapshot(snapshot)}")
+    before = (baselines or {}).get("all" if profile == "minimal" else "minimal")
+    if startup and before:
+        lines.append(
+            f"{before['profile']}_to_{profile}: rss_mb {startup['rss_mb'] - before['rss_mb']:+.1f}, "
+            f"members_cached {startup['members_cached'] - before['members_cached']:+d} (at startup)"
+        )
+
+    lines.append("per_guild:")
+    for guild in guilds[:top]:
+        lines.append(f"  - {guild.id}: cached={len(guild.members)} full={guild.member_count or 0}")
+    return "\n".join(lines)
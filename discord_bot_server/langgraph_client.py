@@ -2,12 +2,18 @@ import asyncio
 import json
 import logging
 import os
-from dataclasses import dataclass
-from typing import Any, Optional
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 from urllib.parse import urljoin
 
 import aiohttp
 
+from circuit_breaker import CircuitOpen
+from http_client import HttpClient
+
 
 log = logging.getLogger(__name__)
 
@@ -21,6 +27,7 @@ class LangGraphTestResult:
     raw_body: str = ""
     response_json: Any = None
     error: Optional[str] = None
+    streamed: bool = False
 
 
 def _get_timeout_seconds() -> float:
@@ -43,6 +50,69 @@ def get_langgraph_test_url() -> str:
     return urljoin(base_url.rstrip("/") + "/", endpoint.lstrip("/"))
 
 
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except ValueError:
+        return default
+
+
+_APOSTROPHES = re.compile(r"['\u2019]")
+# Sentence punctuation only: operators and symbols ("2+2", "c++", "c#") are part of the question
+_EDGE_PUNCTUATION = "?!.,;:\u2026"
+
+
+def normalize_prompt(text: str) -> str:
+    """Case, spacing and leading/trailing ``?!.,;:`` folded away: "What can you do?" matches "what can you do"."""
+    text = _APOSTROPHES.sub("", unicodedata.normalize("NFKC", text).casefold())
+    return " ".join(text.split()).strip(_EDGE_PUNCTUATION + " ")
+
+
+@dataclass(frozen=True)
+class LangGraphConfig:
+    url: str
+    timeout_seconds: float
+    headers: Dict[str, str] = field(default_factory=dict)
+    stream: bool = False
+    stream_edit_interval: float = 1.2
+    reply_cache: bool = False
+    reply_cache_size: int = 256
+    reply_cache_ttl: float = 600.0
+    reply_cache_max_chars: int = 200
+
+
+@lru_cache(maxsize=None)
+def get_langgraph_config() -> LangGraphConfig:
+    """LangGraph settings, read from the environment once per process."""
+    headers = {"content-type": "application/json"}
+
+    api_key = os.getenv("LANGGRAPH_API_KEY", "").strip()
+    if api_key:
+        headers["authorization"] = f"Bearer {api_key}"
+
+    try:
+        stream_edit_interval = float(os.getenv("LANGGRAPH_STREAM_EDIT_INTERVAL_SECONDS", "1.2").strip())
+    except ValueError:
+        stream_edit_interval = 1.2
+
+    return LangGraphConfig(
+        url=get_langgraph_test_url(),
+        timeout_seconds=_get_timeout_seconds(),
+        headers=headers,
+        stream=_env_flag("LANGGRAPH_STREAM"),
+        # Discord allows about 5 edits per 5 seconds per channel
+        stream_edit_interval=max(stream_edit_interval, 1.0),
+        reply_cache=_env_flag("LANGGRAPH_REPLY_CACHE"),
+        reply_cache_size=int(_env_number("LANGGRAPH_REPLY_CACHE_SIZE", 256)),
+        reply_cache_ttl=_env_number("LANGGRAPH_REPLY_CACHE_TTL_SECONDS", 600.0),
+        reply_cache_max_chars=int(_env_number("LANGGRAPH_REPLY_CACHE_MAX_CHARS", 200)),
+    )
+
+
 def _extract_text_from_payload(value: Any) -> str:
     if value is None:
         return ""
@@ -100,25 +170,127 @@ def parse_langgraph_response(raw_body: str, response_json: Any = None) -> str:
     return stripped_body
 
 
+STREAM_CONTENT_TYPES = ("text/event-stream", "application/x-ndjson", "application/jsonl", "application/ndjson")
+
+
+def _extract_chunk_text(data: str) -> Tuple[str, bool]:
+    """Text carried by one stream event, and whether it is the whole reply so far.
+
+    Plain strings and ``delta``/``chunk``/``token`` fields are new text only;
+    any other JSON (``output``, ``final_response``, ...) is taken as the reply
+    so far. Deltas keep their whitespace.
+    """
+    try:
+        value = json.loads(data)
+    except json.JSONDecodeError:
+        return data, False
+
+    if isinstance(value, str):
+        return value, False
+
+    if isinstance(value, dict):
+        for key in ("delta", "chunk", "token"):
+            piece = value.get(key)
+            if isinstance(piece, dict):
+                piece = piece.get("content", piece.get("text"))
+            if isinstance(piece, str):
+                return piece, False
+
+    return _extract_text_from_payload(value), True
+
+
+async def _read_stream(
+    response: aiohttp.ClientResponse,
+    on_chunk: Callable[[str], Awaitable[None]],
+) -> Tuple[str, str]:
+    """Consume an SSE or NDJSON body, calling ``on_chunk`` with the reply so far."""
+    is_sse = response.headers.get("content-type", "").lower().startswith("text/event-stream")
+    text = ""
+    raw_lines = []
+    data_lines = []
+    # Servers either stream the whole reply so far or only the new part; the first event decides which
+    cumulative: Optional[bool] = None
+
+    async def handle(data: str):
+        nonlocal text, cumulative
+        if not data.strip() or data.strip() == "[DONE]":
+            return
+        piece, is_whole = _extract_chunk_text(data)
+        if not piece:
+            return
+        if cumulative is None:
+            cumulative = is_whole
+        text = piece if cumulative else text + piece
+        await on_chunk(text)
+
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+        raw_lines.append(line)
+
+        if not is_sse:
+            await handle(line)
+            continue
+
+        if line.startswith("data:"):
+            data = line[5:]
+            data_lines.append(data[1:] if data.startswith(" ") else data)
+        elif not line and data_lines:
+            # A blank line ends one SSE event
+            await handle("\n".join(data_lines))
+            data_lines = []
+
+    if data_lines:
+        await handle("\n".join(data_lines))
+
+    return text.strip(), "\n".join(raw_lines)
+
+
 async def send_test_payload_to_langgraph(
-    session: aiohttp.ClientSession,
+    http: HttpClient,
     payload: dict,
     logger: Optional[logging.Logger] = None,
+    config: Optional[LangGraphConfig] = None,
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
 ) -> LangGraphTestResult:
-    active_logger = logger or log
-    url = get_langgraph_test_url()
-    timeout_seconds = _get_timeout_seconds()
-    timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-    headers = {"content-type": "application/json"}
+    """POST ``payload`` to LangGraph.
 
-    api_key = os.getenv("LANGGRAPH_API_KEY", "").strip()
-    if api_key:
-        headers["authorization"] = f"Bearer {api_key}"
+    With ``on_chunk`` and a streaming server (SSE or NDJSON), ``on_chunk`` is
+    called with the reply so far as chunks arrive. Other servers are read in
+    full, as before.
+    """
+    active_logger = logger or log
+    config = config or get_langgraph_config()
+    url = config.url
+    timeout_seconds = config.timeout_seconds
+    # A streamed reply may legitimately run long: only connecting and the wait for each read are bounded
+    timeout = http.generation_timeout_for("langgraph", timeout_seconds, stream=on_chunk is not None)
+    headers = config.headers
+    if on_chunk is not None:
+        headers = {**headers, "accept": ", ".join(STREAM_CONTENT_TYPES + ("application/json",))}
 
     active_logger.info("Posting LangGraph test payload to %s", url)
 
     try:
-        async with session.post(url, json=payload, headers=headers, timeout=timeout) as response:
+        async with http.request(
+            "langgraph", "POST", url, json=payload, headers=headers, timeout=timeout
+        ) as response:
+            content_type = response.headers.get("content-type", "").lower()
+            if (
+                on_chunk is not None
+                and 200 <= response.status < 300
+                and content_type.startswith(STREAM_CONTENT_TYPES)
+            ):
+                reply_text, raw_body = await _read_stream(response, on_chunk)
+                active_logger.info("LangGraph streamed reply with HTTP %s", response.status)
+                return LangGraphTestResult(
+                    ok=True,
+                    url=url,
+                    status=response.status,
+                    raw_body=raw_body,
+                    reply_text=reply_text,
+                    streamed=True,
+                )
+
             raw_body = await response.text()
             response_json = None
 
@@ -160,6 +332,9 @@ async def send_test_payload_to_langgraph(
     except asyncio.TimeoutError:
         active_logger.exception("LangGraph request timed out after %s seconds", timeout_seconds)
         return LangGraphTestResult(ok=False, url=url, error="request timed out")
+    except CircuitOpen as exc:
+        active_logger.warning("LangGraph request skipped: %s", exc)
+        return LangGraphTestResult(ok=False, url=url, error=str(exc))
     except aiohttp.ClientError as exc:
         active_logger.exception("LangGraph request failed: %s", exc)
         return LangGraphTestResult(ok=False, url=url, error=str(exc))
@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import warnings
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Optional
+
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class LavalinkNodeConfig:
+    label: str
+    host: str
+    port: int
+    password: str
+    secure: bool = False
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def load_node_configs() -> List[LavalinkNodeConfig]:
+    """Read the Lavalink nodes to connect to.
+
+    ``LAVALINK_NODES`` holds a JSON list such as
+    ``[{"label": "MAIN", "host": "127.0.0.1", "port": 2333, "password": "..."}]``.
+    Without it a single node is built from ``LAVALINK_HOST``/``LAVALINK_PORT``/
+    ``LAVALINK_PASSWORD``/``LAVALINK_SECURE``.
+    """
+    raw_nodes = os.getenv("LAVALINK_NODES", "").strip()
+    if raw_nodes:
+        try:
+            entries = json.loads(raw_nodes)
+        except json.JSONDecodeError as exc:
+            log.error("LAVALINK_NODES is not valid JSON, using the single-node settings: %s", exc)
+            entries = None
+
+        if isinstance(entries, list):
+            configs = []
+            for index, entry in enumerate(entries):
+                try:
+                    configs.append(
+                        LavalinkNodeConfig(
+                            label=str(entry.get("label") or f"NODE{index + 1}"),
+                            host=str(entry["host"]),
+                            port=int(entry.get("port", 2333)),
+                            password=str(entry.get("password", "")),
+                            secure=_parse_bool(entry.get("secure", False)),
+                        )
+                    )
+                except (AttributeError, KeyError, TypeError, ValueError) as exc:
+                    log.error("Skipping invalid LAVALINK_NODES entry %s: %s", index, exc)
+            if configs:
+                return configs
+
+    try:
+        port = int(os.getenv("LAVALINK_PORT", "2333"))
+    except ValueError:
+        port = 2333
+
+    return [
+        LavalinkNodeConfig(
+            label=os.getenv("LAVALINK_LABEL", "MAIN").strip() or "MAIN",
+            host=os.getenv("LAVALINK_HOST", "127.0.0.1").strip(),
+            port=port,
+            password=os.getenv("LAVALINK_PASSWORD", "zerotwo"),
+            secure=_parse_bool(os.getenv("LAVALINK_SECURE", "false")),
+        )
+    ]
+
+
+def node_is_healthy(node: object) -> bool:
+    """Robust check across Mafic versions for 'can this node take players?'."""
+    for attr in ("available", "connected"):
+        val = getattr(node, attr, None)
+        if isinstance(val, bool):
+            return val
+    return False
+
+
+def node_penalty(node: object) -> float:
+    """Lavalink's load-balancing penalty: playing players, CPU load and frame loss."""
+    stats = getattr(node, "stats", None)
+    if stats is None:
+        # No stats yet (fresh node): fall back to the players we know about
+        return float(len(getattr(node, "players", None) or ()))
+
+    players = getattr(stats, "playing_player_count", None)
+    if players is None:
+        players = getattr(stats, "playing_players", 0)
+
+    cpu = getattr(stats, "cpu", None)
+    # system_load is 0..1 for the whole machine
+    system_load = float(getattr(cpu, "system_load", 0.0) or 0.0)
+    cpu_penalty = 1.05 ** (100 * system_load) * 10 - 10
+
+    frames = getattr(stats, "frame_stats", None)
+    deficit_penalty = 0.0
+    nulled_penalty = 0.0
+    if frames is not None:
+        deficit = float(getattr(frames, "deficit", 0) or 0)
+        nulled = float(getattr(frames, "nulled", 0) or 0)
+        deficit_penalty = 1.03 ** (500 * (deficit / 3000)) * 600 - 600
+        nulled_penalty = (1.03 ** (500 * (nulled / 3000)) * 300 - 300) * 2
+
+    return float(players) + cpu_penalty + deficit_penalty + nulled_penalty
+
+
+def pool_nodes(pool: object) -> List[object]:
+    """Every node in the pool, including ones that are down (Mafic's ``nodes`` lists only available ones)."""
+    nodes = getattr(pool, "label_to_node", None)
+    if nodes is None:
+        nodes = getattr(pool, "nodes", None)
+    if nodes is None:
+        return []
+    if isinstance(nodes, dict):
+        return list(nodes.values())
+    return list(nodes)
+
+
+def best_node(pool: object, exclude: Iterable[object] = ()) -> Optional[object]:
+    """Healthy node with the lowest penalty, or None if every node is down."""
+    excluded = {id(node) for node in exclude}
+    candidates = [node for node in pool_nodes(pool) if id(node) not in excluded and node_is_healthy(node)]
+    if not candidates:
+        return None
+    return min(candidates, key=node_penalty)
+
+
+def _ignore_mafic_version_warning() -> None:
+    # The warning class name differs across Mafic versions
+    try:
+        from mafic.pool import UnsupportedVersionWarning as MaficVersionWarning
+    except Exception:
+        try:
+            from mafic.pool import UnknownVersionWarning as MaficVersionWarning
+        except Exception:
+            MaficVersionWarning = Warning
+    warnings.filterwarnings("ignore", category=MaficVersionWarning)
+
+
+async def ensure_lavalink_nodes(bot) -> None:
+    """Create the node pool and connect every configured node that isn't connected yet.
+
+    Mafic is imported here rather than at startup, so bots without the music cog never load it.
+    """
+    import mafic
+
+    if not hasattr(bot, "lavalink"):
+        _ignore_mafic_version_warning()
+        bot.lavalink = mafic.NodePool(bot)
+        bot.lavalink_labels = set()
+
+    # on_ready fires again on every gateway reconnect; only create nodes we don't have yet
+    for node in load_node_configs():
+        if node.label in bot.lavalink_labels:
+            continue
+        try:
+            await bot.lavalink.create_node(
+                host=node.host,
+                port=node.port,
+                password=node.password,
+                label=node.label,
+                secure=node.secure,
+            )
+        except Exception as e:
+            log.exception("Failed to connect Lavalink node %s at %s:%s: %s", node.label, node.host, node.port, e)
+            continue
+        bot.lavalink_labels.add(node.label)
+        log.info("Connected Lavalink node %s at %s:%s", node.label, node.host, node.port)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List, Optional
+
+
+log = logging.getLogger(__name__)
+
+BOT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class StallReport:
+    started_at: float               # wall clock, for display
+    duration: float                 # seconds the loop did not run
+    task: str                       # asyncio task that held the loop ("discord.py: on_message", ...)
+    command: Optional[str]          # command being invoked, if any
+    location: str                   # innermost bot frame: file:line in function
+    stack: str
+
+    def describe(self) -> str:
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at))
+        command = f" command={self.command}" if self.command else ""
+        return f"{when} {self.duration * 1000:.0f}ms task={self.task!r}{command} at {self.location}"
+
+
+def _attribute(frame) -> tuple:
+    """(command name, innermost frame in the bot's own code) for a captured stack."""
+    command = None
+    location = "unknown"
+    while frame is not None:
+        code = frame.f_code
+        if location == "unknown" and code.co_filename.startswith(BOT_ROOT):
+            name = getattr(code, "co_qualname", code.co_name)
+            location = f"{os.path.relpath(code.co_filename, BOT_ROOT)}:{frame.f_lineno} in {name}"
+        if command is None:
+            ctx = frame.f_locals.get("ctx")
+            qualified_name = getattr(getattr(ctx, "command", None), "qualified_name", None)
+            if qualified_name:
+                command = qualified_name
+        frame = frame.f_back
+    return command, location
+
+
+class LoopWatchdog:
+    """Notices when the event loop stops running callbacks and records what blocked it.
+
+    A callback on the loop bumps a heartbeat every ``interval`` seconds. A daemon
+    thread checks that heartbeat; once it is ``threshold`` seconds old, the thread
+    grabs the loop thread's current stack (the code that is blocking) and the
+    running task. When the loop comes back, the stall is logged and kept in a ring
+    buffer of ``history`` reports.
+    """
+
+    def __init__(self, threshold: float = 0.5, history: int = 50):
+        self.threshold = max(threshold, 0.05)
+        self.interval = self.threshold / 4
+        self.reports: Deque[StallReport] = deque(maxlen=max(history, 1))
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._pending: Optional[StallReport] = None
+        self._pending_since = 0.0
+        self._lock = threading.Lock()
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start watching the running loop. Must be called from the loop thread."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._handle = self._loop.call_soon(self._beat)
+        self._thread = threading.Thread(target=self._watch, name="arisu-loop-watchdog", daemon=True)
+        self._thread.start()
+        log.info("Loop watchdog started (threshold %.0f ms)", self.threshold * 1000)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    # ---------- Loop side ----------
+    def _beat(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._last_beat = now
+        if pending is not None:
+            pending.duration = now - self._pending_since
+            self._record(pending)
+        self._handle = self._loop.call_later(self.interval, self._beat)
+
+    def _record(self, report: StallReport) -> None:
+        self.stalls += 1
+        self.stalled_seconds += report.duration
+        self.reports.append(report)
+        log.warning("Event loop stalled: %s", report.describe())
+
+    # ---------- Watchdog thread ----------
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            last_beat = self._last_beat
+            # The beat is due every `interval`; anything past that is time the loop did not run
+            stalled_for = time.monotonic() - last_beat - self.interval
+            if stalled_for < self.threshold or self._pending is not None:
+                continue
+            report = self._capture()
+            with self._lock:
+                # Only keep it if the loop is still stuck in the same stall
+                if report is not None and self._last_beat == last_beat:
+                    report.started_at -= stalled_for
+                    self._pending_since = last_beat + self.interval
+                    self._pending = report
+
+    def _capture(self) -> Optional[StallReport]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+
+        task_name = "callback"
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        if task is not None:
+            task_name = task.get_name()
+
+        try:
+            command, location = _attribute(frame)
+        except Exception:
+            command, location = None, "unknown"
+        stack = "".join(traceback.format_stack(frame))
+        return StallReport(time.time(), 0.0, task_name, command, location, stack)
+
+    def recent(self, count: int) -> List[StallReport]:
+        return list(self.reports)[-count:]
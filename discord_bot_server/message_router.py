@@ -0,0 +1,49 @@
+import re
+from typing import Optional
+
+
+# Optional friendly prefix people put after the mention: "@Arisu | Zero Two's proxy - hi"
+PROXY_PREFIX = "zero two's proxy"
+
+
+class MessageRouter:
+    """Decides, as cheaply as possible, whether ``on_message`` has anything to do.
+
+    Almost every message the bot sees is chatter: no command prefix and no
+    mention of the bot. Those are rejected with one ``startswith`` and a look at
+    ``message.mentions`` (already parsed by discord.py, and nearly always
+    empty), without copying the content or building a command context.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.bot_id: Optional[int] = None
+        self._mention_re: Optional["re.Pattern[str]"] = None
+
+    def bind(self, bot_id: int) -> None:
+        self.bot_id = bot_id
+        self._mention_re = re.compile(rf"<@!?{bot_id}>")
+
+    def mentions_bot(self, message) -> bool:
+        bot_id = self.bot_id
+        for user in message.mentions:
+            if user.id == bot_id:
+                return True
+        return False
+
+    def route(self, message) -> Optional[str]:
+        """None: ignore the message. Otherwise the Zero Two prompt it carries ("" if none)."""
+        if message.mentions and self.mentions_bot(message):
+            return self.prompt(message.content)
+        if message.content.startswith(self.prefix):
+            return ""
+        return None
+
+    def prompt(self, content: str) -> str:
+        """Message text with the bot mention and the optional proxy prefix removed."""
+        content = self._mention_re.sub("", content).strip()
+        if content.startswith("|"):
+            content = content[1:].lstrip()
+        if content[: len(PROXY_PREFIX)].lower() == PROXY_PREFIX:
+            content = content[len(PROXY_PREFIX):].lstrip(" -:|\t")
+        return content
@@ -0,0 +1,199 @@
+import enum
+import itertools
+import random
+from collections import deque
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+
+class RepeatMode(enum.Enum):
+    OFF = "off"
+    TRACK = "track"
+    QUEUE = "queue"
+
+
+class QueueEntry:
+    """One queued track: just Lavalink's encoded string plus what !queue displays.
+
+    Mafic Track objects carry every field Lavalink returns; for guilds with
+    thousands of queued tracks these slots keep each entry small. The encoded
+    string is all ``Player.play`` needs.
+    """
+
+    __slots__ = ("track", "title", "length", "uri", "seq", "ready")
+
+    def __init__(self, track: str, title: str = "unknown", length: int = 0, uri: Optional[str] = None, seq: int = 0):
+        self.track = track
+        self.title = title
+        self.length = length          # milliseconds
+        self.uri = uri                # source URL, used to check the track still loads
+        self.seq = seq                # row key in Music_Queue
+        self.ready = False            # checked by the preloader
+
+    @classmethod
+    def from_track(cls, track: object) -> "QueueEntry":
+        return cls(
+            getattr(track, "id", ""),
+            getattr(track, "title", None) or "unknown",
+            int(getattr(track, "length", 0) or 0),
+            getattr(track, "uri", None),
+        )
+
+
+class TrackQueue:
+    """A guild's upcoming tracks, the one playing, repeat mode and recent history.
+
+    Entries are kept in small blocks of at most ``BLOCK_SIZE``. Indexed get,
+    remove and move touch one block plus the list of block sizes. With the
+    queue capped at MUSIC_MAX_QUEUE_LENGTH that is a bounded number of steps
+    whatever the position, instead of shifting half the queue. Taking the next
+    track and appending stay O(1).
+    """
+
+    BLOCK_SIZE = 64
+
+    def __init__(self, history_size: int = 50):
+        self._blocks: Deque[List[QueueEntry]] = deque()
+        self._size = 0
+        self.history: Deque[QueueEntry] = deque(maxlen=max(history_size, 1))
+        self.current: Optional[QueueEntry] = None
+        self.repeat = RepeatMode.OFF
+        self._next_seq = 1
+        # True once _next_seq is known to be past every Music_Queue row for the guild
+        self.seeded = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[QueueEntry]:
+        return itertools.chain.from_iterable(self._blocks)
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """(block number, offset in that block) of queue position ``index``."""
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("queue index out of range")
+        if index >= self._size - len(self._blocks[-1]):
+            return len(self._blocks) - 1, index - (self._size - len(self._blocks[-1]))
+        for number, block in enumerate(self._blocks):
+            if index < len(block):
+                return number, index
+            index -= len(block)
+        raise IndexError("queue index out of range")
+
+    def __getitem__(self, index: int) -> QueueEntry:
+        number, offset = self._locate(index)
+        return self._blocks[number][offset]
+
+    @property
+    def total_length(self) -> int:
+        return sum(entry.length for entry in self)
+
+    def _number(self, entries: Iterable[QueueEntry]) -> None:
+        for entry in entries:
+            entry.seq = self._next_seq
+            self._next_seq += 1
+
+    def _append(self, entries: Iterable[QueueEntry]) -> None:
+        for entry in entries:
+            if not self._blocks or len(self._blocks[-1]) >= self.BLOCK_SIZE:
+                self._blocks.append([])
+            self._blocks[-1].append(entry)
+            self._size += 1
+
+    def _rebuild(self, entries: List[QueueEntry]) -> None:
+        self._blocks = deque(entries[i:i + self.BLOCK_SIZE] for i in range(0, len(entries), self.BLOCK_SIZE))
+        self._size = len(entries)
+
+    def seed(self, next_seq: int) -> None:
+        """Continue numbering after rows already saved for the guild."""
+        self._next_seq = max(self._next_seq, next_seq)
+        self.seeded = True
+
+    def extend(self, entries: List[QueueEntry]) -> None:
+        """Append entries, giving each a new sequence number."""
+        self._number(entries)
+        self._append(entries)
+
+    def restore(self, entries: List[QueueEntry]) -> None:
+        """Append entries that already have sequence numbers (loaded from the database)."""
+        self._append(entries)
+        if entries:
+            self._next_seq = max(self._next_seq, max(entry.seq for entry in entries) + 1)
+
+    def advance(self, finished_normally: bool = True) -> Tuple[Optional[QueueEntry], Optional[QueueEntry]]:
+        """Move to the next track. Returns (new current entry, entry re-added to the end by queue repeat).
+
+        A track that ended early (skipped, failed) is not repeated in track mode.
+        """
+        finished = self.current
+        requeued = None
+        if finished is not None:
+            if self.repeat is RepeatMode.TRACK and finished_normally:
+                return finished, None
+            self.history.append(finished)
+            if self.repeat is RepeatMode.QUEUE:
+                requeued = QueueEntry(finished.track, finished.title, finished.length, finished.uri)
+                self.extend([requeued])
+
+        self.current = self.remove(0) if self._size else None
+        return self.current, requeued
+
+    def remove(self, index: int) -> QueueEntry:
+        number, offset = self._locate(index)
+        block = self._blocks[number]
+        entry = block.pop(offset)
+        self._size -= 1
+        if not block:
+            del self._blocks[number]
+        return entry
+
+    def insert(self, index: int, entry: QueueEntry) -> None:
+        if index >= self._size:
+            self._append([entry])
+            return
+        number, offset = self._locate(max(index, 0))
+        block = self._blocks[number]
+        block.insert(offset, entry)
+        self._size += 1
+        if len(block) > 2 * self.BLOCK_SIZE:
+            self._blocks.insert(number + 1, block[self.BLOCK_SIZE:])
+            del block[self.BLOCK_SIZE:]
+
+    def move(self, source: int, destination: int) -> QueueEntry:
+        entry = self.remove(source)
+        self.insert(destination, entry)
+        return entry
+
+    def shuffle(self) -> None:
+        entries = list(self)
+        random.shuffle(entries)
+        self._rebuild(entries)
+
+    def dedupe(self) -> List[QueueEntry]:
+        """Drop later copies of the same track; returns the removed entries."""
+        seen = {self.current.track} if self.current is not None else set()
+        kept: List[QueueEntry] = []
+        removed = []
+        for entry in self:
+            if entry.track in seen:
+                removed.append(entry)
+            else:
+                seen.add(entry.track)
+                kept.append(entry)
+        self._rebuild(kept)
+        return removed
+
+    def renumber(self) -> None:
+        """Give entries fresh, ordered sequence numbers after a reorder.
+
+        Numbering starts after the playing entry's seq, so a track repeated in
+        track mode never shares a seq with a queued row.
+        """
+        self._next_seq = self.current.seq + 1 if self.current is not None else 1
+        self._number(self)
+
+    def clear(self) -> None:
+        self._blocks.clear()
+        self._size = 0
+        self.current = None
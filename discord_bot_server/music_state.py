@@ -0,0 +1,124 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from database import Database
+
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class SavedSession:
+    guild_id: int
+    channel_id: int
+    track: Optional[str] = None       # Lavalink encoded track string
+    position_ms: int = 0
+    queue: List[Tuple[int, str]] = field(default_factory=list)   # (seq, encoded track)
+
+
+def _load_sessions(connection) -> List[SavedSession]:
+    sessions: Dict[int, SavedSession] = {}
+    for guild_id, channel_id, track, position_ms in connection.execute(
+        "SELECT guild_id, channel_id, track, position_ms FROM Music_Session"
+    ):
+        sessions[guild_id] = SavedSession(guild_id, channel_id, track, position_ms or 0)
+    for guild_id, seq, track in connection.execute("SELECT guild_id, seq, track FROM Music_Queue ORDER BY guild_id, seq"):
+        session = sessions.get(guild_id)
+        if session is not None:
+            session.queue.append((seq, track))
+    return list(sessions.values())
+
+
+def _start_track(connection, guild_id: int, channel_id: int, track: Optional[str], popped_seq: Optional[int]) -> None:
+    connection.execute(
+        "INSERT OR REPLACE INTO Music_Session (guild_id, channel_id, track, position_ms) VALUES (?, ?, ?, 0)",
+        (guild_id, channel_id, track),
+    )
+    if popped_seq is not None:
+        connection.execute("DELETE FROM Music_Queue WHERE guild_id = ? AND seq = ?", (guild_id, popped_seq))
+
+
+def _rewrite_queue(connection, guild_id: int, entries: Sequence[Tuple[int, str]]) -> None:
+    connection.execute("DELETE FROM Music_Queue WHERE guild_id = ?", (guild_id,))
+    connection.executemany(
+        "INSERT INTO Music_Queue (guild_id, seq, track) VALUES (?, ?, ?)",
+        [(guild_id, seq, track) for seq, track in entries],
+    )
+
+
+def _forget(connection, guild_id: int) -> None:
+    connection.execute("DELETE FROM Music_Queue WHERE guild_id = ?", (guild_id,))
+    connection.execute("DELETE FROM Music_Session WHERE guild_id = ?", (guild_id,))
+
+
+class MusicStateStore:
+    """Music sessions and queues kept in SQLite so a restart can pick up where it left off.
+
+    Each change is a small write of its own (queued tracks, one finished
+    track, one position); only reordering the queue rewrites it. Tracks are stored
+    as Lavalink's encoded track strings, which any node can decode or play.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def load(self) -> List[SavedSession]:
+        return await self.db.run(_load_sessions)
+
+    async def next_seq(self, guild_id: int) -> int:
+        """First sequence number after the guild's saved queue rows."""
+        row = await self.db.fetchone("SELECT MAX(seq) FROM Music_Queue WHERE guild_id = ?", (guild_id,))
+        return (row[0] or 0) + 1 if row else 1
+
+    async def push_many(self, guild_id: int, entries: Sequence[Tuple[int, str]]) -> None:
+        """Append (seq, encoded track) rows, e.g. a whole playlist, in one transaction."""
+        if not entries:
+            return
+        await self.db.run(
+            lambda conn: conn.executemany(
+                "INSERT INTO Music_Queue (guild_id, seq, track) VALUES (?, ?, ?)",
+                [(guild_id, seq, track) for seq, track in entries],
+            ),
+            operation="push_many",
+        )
+
+    async def remove(self, guild_id: int, seqs: Sequence[int]) -> None:
+        if not seqs:
+            return
+        await self.db.run(
+            lambda conn: conn.executemany(
+                "DELETE FROM Music_Queue WHERE guild_id = ? AND seq = ?", [(guild_id, seq) for seq in seqs]
+            ),
+            operation="remove",
+        )
+
+    async def rewrite_queue(self, guild_id: int, entries: Sequence[Tuple[int, str]]) -> None:
+        """Replace the saved queue after a reorder (move, shuffle)."""
+        await self.db.run(_rewrite_queue, guild_id, list(entries))
+
+    async def start_track(self, guild_id: int, channel_id: int, track: Optional[str], popped_seq: Optional[int] = None) -> None:
+        """The player started ``track``; ``popped_seq`` is the queue row it came from, if any."""
+        await self.db.run(_start_track, guild_id, channel_id, track, popped_seq)
+
+    async def clear_track(self, guild_id: int) -> None:
+        """The player went idle: nothing to resume, but it is still in its channel."""
+        await self.db.execute("UPDATE Music_Session SET track = NULL, position_ms = 0 WHERE guild_id = ?", (guild_id,))
+
+    async def set_channel(self, guild_id: int, channel_id: int) -> None:
+        await self.db.execute("UPDATE Music_Session SET channel_id = ? WHERE guild_id = ?", (channel_id, guild_id))
+
+    async def save_positions(self, positions: Sequence[Tuple[int, int]]) -> None:
+        """Checkpoint playback positions, as (guild_id, position_ms) pairs, in one transaction."""
+        if not positions:
+            return
+        await self.db.run(
+            lambda conn: conn.executemany(
+                "UPDATE Music_Session SET position_ms = ? WHERE guild_id = ?",
+                [(position_ms, guild_id) for guild_id, position_ms in positions],
+            ),
+            operation="save_positions",
+        )
+
+    async def forget(self, guild_id: int) -> None:
+        await self.db.run(_forget, guild_id)
@@ -0,0 +1,172 @@
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Type
+
+from discord.ext import commands
+
+
+log = logging.getLogger(__name__)
+
+SHARD_MODES = ("single", "auto", "cluster")
+
+# A crashed cluster process is restarted after this delay, doubled on each crash up to the maximum
+CLUSTER_RESTART_DELAY_SECONDS = 5.0
+CLUSTER_RESTART_MAX_DELAY_SECONDS = 300.0
+# A process that stayed up this long before crashing starts again from the shortest delay
+CLUSTER_STABLE_SECONDS = 60.0
+
+
+def _env_int(name: str) -> Optional[int]:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        log.error("%s must be an integer, ignoring %r", name, raw)
+        return None
+
+
+@dataclass(frozen=True)
+class ShardConfig:
+    """How this process connects to the gateway.
+
+    ``single``  one connection (the old behaviour)
+    ``auto``    AutoShardedBot running every shard in this process
+    ``cluster`` one launcher process starting ``cluster_count`` bot processes,
+                each running its own contiguous range of shards
+    """
+
+    mode: str = "single"
+    shard_count: Optional[int] = None
+    cluster_count: int = 1
+    cluster_id: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "ShardConfig":
+        mode = os.getenv("BOT_SHARD_MODE", "single").strip().lower() or "single"
+        if mode not in SHARD_MODES:
+            log.error("Unknown BOT_SHARD_MODE %r, using 'single'", mode)
+            mode = "single"
+
+        config = cls(
+            mode=mode,
+            shard_count=_env_int("SHARD_COUNT"),
+            cluster_count=max(_env_int("CLUSTER_COUNT") or 1, 1),
+            cluster_id=_env_int("CLUSTER_ID"),
+        )
+        if mode == "cluster":
+            if not config.shard_count:
+                raise RuntimeError("BOT_SHARD_MODE=cluster needs SHARD_COUNT so every process agrees on the shard layout")
+            if config.shard_count < config.cluster_count:
+                raise RuntimeError(
+                    f"SHARD_COUNT ({config.shard_count}) must be at least CLUSTER_COUNT ({config.cluster_count}): "
+                    "every cluster process needs a shard"
+                )
+            if config.cluster_id is not None and not 0 <= config.cluster_id < config.cluster_count:
+                raise RuntimeError(f"CLUSTER_ID must be between 0 and {config.cluster_count - 1}, got {config.cluster_id}")
+        return config
+
+    @property
+    def is_launcher(self) -> bool:
+        return self.mode == "cluster" and self.cluster_id is None
+
+    def shard_ids(self) -> Optional[List[int]]:
+        if self.mode != "cluster" or self.cluster_id is None or not self.shard_count:
+            return None
+        # The first ``extra`` clusters take one shard more, so no cluster is left empty
+        per_cluster, extra = divmod(self.shard_count, self.cluster_count)
+        start = self.cluster_id * per_cluster + min(self.cluster_id, extra)
+        size = per_cluster + (1 if self.cluster_id < extra else 0)
+        return list(range(start, start + size))
+
+    def bot_class(self) -> Type[commands.Bot]:
+        return commands.Bot if self.mode == "single" else commands.AutoShardedBot
+
+    def bot_kwargs(self) -> Dict[str, Any]:
+        if self.mode == "single":
+            return {}
+        kwargs: Dict[str, Any] = {}
+        if self.shard_count:
+            kwargs["shard_count"] = self.shard_count
+        shard_ids = self.shard_ids()
+        if shard_ids is not None:
+            kwargs["shard_ids"] = shard_ids
+        return kwargs
+
+    def describe(self) -> str:
+        if self.mode == "single":
+            return "single connection"
+        if self.mode == "auto":
+            return f"auto-sharded ({self.shard_count or 'recommended'} shards)"
+        return f"cluster {self.cluster_id}/{self.cluster_count}, shards {self.shard_ids()} of {self.shard_count}"
+
+
+def run_cluster_launcher(config: ShardConfig, script: str) -> int:
+    """Start one bot process per cluster, restart any that crash, and return once all have exited.
+
+    A process that exits with status 0 is done. One that exits otherwise is
+    logged and started again after a backoff, until the launcher itself gets
+    SIGTERM/SIGINT, which is forwarded to every process.
+    """
+    processes: Dict[int, subprocess.Popen] = {}
+    started_at: Dict[int, float] = {}
+    delays: Dict[int, float] = {}
+    # cluster_id -> monotonic time a crashed process may start again
+    restart_at: Dict[int, float] = {}
+    stopping = False
+    exit_code = 0
+
+    def _start(cluster_id: int) -> None:
+        env = dict(os.environ, CLUSTER_ID=str(cluster_id))
+        log.info("Starting cluster %s/%s", cluster_id, config.cluster_count)
+        processes[cluster_id] = subprocess.Popen([sys.executable, script], env=env)
+        started_at[cluster_id] = time.monotonic()
+
+    def _forward(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        restart_at.clear()
+        for process in processes.values():
+            if process.poll() is None:
+                process.send_signal(signum)
+
+    for cluster_id in range(config.cluster_count):
+        _start(cluster_id)
+    signal.signal(signal.SIGTERM, _forward)
+    signal.signal(signal.SIGINT, _forward)
+
+    while processes or restart_at:
+        now = time.monotonic()
+        for cluster_id, process in list(processes.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            del processes[cluster_id]
+            if code == 0 or stopping:
+                log.info("Cluster %s exited with status %s", cluster_id, code)
+                exit_code = max(exit_code, code)
+                continue
+            uptime = now - started_at[cluster_id]
+            if uptime >= CLUSTER_STABLE_SECONDS:
+                delays[cluster_id] = CLUSTER_RESTART_DELAY_SECONDS
+            else:
+                delays[cluster_id] = min(
+                    delays.get(cluster_id, CLUSTER_RESTART_DELAY_SECONDS / 2) * 2, CLUSTER_RESTART_MAX_DELAY_SECONDS
+                )
+            log.error(
+                "Cluster %s crashed with status %s after %.0fs, restarting in %.0fs",
+                cluster_id, code, uptime, delays[cluster_id],
+            )
+            restart_at[cluster_id] = now + delays[cluster_id]
+        for cluster_id, when in list(restart_at.items()):
+            if now >= when:
+                del restart_at[cluster_id]
+                _start(cluster_id)
+        time.sleep(1.0)
+    return exit_code
@@ -0,0 +1,92 @@
+"""Regression tests for queue sequence numbers and the Music_Queue rows they key.
+
+Runs without Discord or Lavalink (needs discord.py and mafic installed, as the bot does):
+
+    python -m unittest test_music_queue
+"""
+import asyncio
+import os
+import random
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from cogs.music import Music
+from database import Database
+from music_queue import QueueEntry, RepeatMode, TrackQueue
+from music_state import MusicStateStore
+
+GUILD_ID = 1
+CHANNEL_ID = 2
+
+
+class FakePlayer:
+    def __init__(self):
+        self.guild = SimpleNamespace(id=GUILD_ID)
+        self.channel = SimpleNamespace(id=CHANNEL_ID)
+        self.played = []
+
+    async def play(self, track, **kwargs):
+        self.played.append(track)
+
+
+class RenumberTest(unittest.TestCase):
+    def test_renumber_starts_after_current(self):
+        q = TrackQueue()
+        q.extend([QueueEntry(f"t{i}") for i in range(5)])
+        q.advance()
+        q.move(3, 0)
+        q.renumber()
+        self.assertNotIn(q.current.seq, [entry.seq for entry in q])
+        self.assertEqual([entry.seq for entry in q], sorted(entry.seq for entry in q))
+
+
+class RepeatAfterReorderTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.directory.name, "test.db"))
+        await self.db.connect()
+        self.music = Music.__new__(Music)
+        self.music.state = MusicStateStore(self.db)
+        self.music.advance_locks = {}
+        self.music.queues = {}
+        self.player = FakePlayer()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.directory.cleanup()
+
+    async def saved_queue(self):
+        rows = await self.db.fetchall("SELECT track FROM Music_Queue WHERE guild_id = ? ORDER BY seq", (GUILD_ID,))
+        return [track for (track,) in rows]
+
+    async def check_repeat_keeps_rows(self, reorder):
+        q = self.music.get_queue(GUILD_ID)
+        entries = [QueueEntry(f"t{i}") for i in range(6)]
+        q.extend(entries)
+        await self.music.state.push_many(GUILD_ID, [(entry.seq, entry.track) for entry in entries])
+
+        await self.music.play_next(self.player)
+        playing = q.current.track
+        q.repeat = RepeatMode.TRACK
+        reorder(q)
+        q.renumber()
+        await self.music.state.rewrite_queue(GUILD_ID, [(entry.seq, entry.track) for entry in q])
+        expected = [entry.track for entry in q]
+
+        # The track ends and repeats: the queue must be untouched, in memory and on disk
+        repeated = await self.music.play_next(self.player)
+        self.assertEqual(repeated.track, playing)
+        self.assertEqual([entry.track for entry in q], expected)
+        self.assertEqual(await self.saved_queue(), expected)
+
+    async def test_move_then_repeat(self):
+        await self.check_repeat_keeps_rows(lambda q: q.move(len(q) - 1, 0))
+
+    async def test_shuffle_then_repeat(self):
+        random.seed(3)
+        await self.check_repeat_keeps_rows(lambda q: q.shuffle())
+
+
+if __name__ == "__main__":
+    unittest.main()
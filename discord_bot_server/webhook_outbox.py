@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import random
+import time
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import Database
+from http_client import HttpClient
+
+
+log = logging.getLogger(__name__)
+
+
+def _put(connection, guild_id: int, seq: int, channel_id: Optional[str], connected: bool, queued_at: float) -> None:
+    connection.execute(
+        "INSERT OR REPLACE INTO Voice_State_Outbox (guild_id, seq, channel_id, connected, queued_at) VALUES (?, ?, ?, ?, ?)",
+        (guild_id, seq, channel_id, int(connected), queued_at),
+    )
+
+
+def _delete_sent(connection, sent: List[Tuple[int, int]]) -> None:
+    # Only the row that was sent: a newer state queued meanwhile has another seq and stays
+    connection.executemany("DELETE FROM Voice_State_Outbox WHERE guild_id = ? AND seq = ?", sent)
+
+
+class VoiceStateOutbox:
+    """n8n voice-state notifications, kept in SQLite until n8n accepts them.
+
+    Each guild has at most one pending row: a newer state replaces the older
+    one, so a reconnect storm sends only the latest state per guild. A single
+    worker sends pending states oldest first, ``batch_size`` per request, and
+    stops at the first failure to retry after an exponential backoff. That keeps
+    delivery in order, and nothing is lost across restarts. A permanent
+    rejection (4xx other than 408/429) will not succeed on retry, so those
+    states are dropped with a log line instead of blocking every guild behind
+    them.
+
+    With ``batch_size`` 1 each request body is the single state object n8n has
+    always received. Larger batches send ``{"events": [...]}``.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        http: HttpClient,
+        url: str,
+        batch_size: int = 1,
+        flush_delay: float = 0.5,
+        timeout: float = 5.0,
+        retry_base: float = 1.0,
+        retry_max: float = 300.0,
+    ):
+        self.db = db
+        self.http = http
+        self.url = url
+        self.batch_size = max(int(batch_size), 1)
+        self.flush_delay = max(flush_delay, 0.0)
+        self.timeout = timeout
+        self.retry_base = max(retry_base, 0.1)
+        self.retry_max = max(retry_max, self.retry_base)
+        self.sent = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        # guild_id -> (seq, queued_at, payload) in seq order; mirrors the table so sends never read the database
+        self._pending: Dict[int, Tuple[int, float, Dict[str, Any]]] = {}
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def backlog(self) -> int:
+        return len(self._pending)
+
+    def oldest_age(self) -> float:
+        """Seconds the oldest pending state has waited (0 with nothing pending)."""
+        if not self._pending:
+            return 0.0
+        _, queued_at, _ = next(iter(self._pending.values()))
+        return max(time.time() - queued_at, 0.0)
+
+    async def start(self) -> None:
+        rows = await self.db.fetchall(
+            "SELECT guild_id, seq, channel_id, connected, queued_at FROM Voice_State_Outbox ORDER BY seq"
+        )
+        for guild_id, seq, channel_id, connected, queued_at in rows:
+            self._pending[guild_id] = (seq, queued_at, self._payload(guild_id, channel_id, bool(connected)))
+            self._seq = max(self._seq, seq)
+        if rows:
+            log.info("Voice-state outbox: %s undelivered states from the last run", len(rows))
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @staticmethod
+    def _payload(guild_id: int, channel_id: Optional[str], connected: bool) -> Dict[str, Any]:
+        return {"guild_id": str(guild_id), "channel_id": channel_id, "connected": connected}
+
+    async def put(self, guild_id: int, channel_id: Optional[str], connected: bool) -> None:
+        """Queue the bot's new voice state in ``guild_id``, replacing any state not yet sent."""
+        self._seq += 1
+        seq, queued_at = self._seq, time.time()
+        # Re-inserting moves the guild to the end, keeping the dict in seq order
+        if self._pending.pop(guild_id, None) is not None:
+            self.coalesced += 1
+        self._pending[guild_id] = (seq, queued_at, self._payload(guild_id, channel_id, connected))
+        await self.db.run(_put, guild_id, seq, channel_id, connected, queued_at)
+        self._wakeup.set()
+
+    async def _worker(self) -> None:
+        failures = 0
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Let a burst of updates coalesce before sending
+            await asyncio.sleep(self.flush_delay)
+            while self._pending:
+                try:
+                    await self._send_batch()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    failures += 1
+                    self.failures += 1
+                    self.last_error = str(e) or type(e).__name__
+                    delay = min(self.retry_base * 2 ** (failures - 1), self.retry_max)
+                    delay *= random.uniform(0.8, 1.2)
+                    log.warning(
+                        "Voice-state outbox: send failed (%s), %s pending, retrying in %.1fs",
+                        self.last_error,
+                        self.backlog,
+                        delay,
+                    )
+                    await asyncio.sleep(delay)
+                else:
+                    failures = 0
+
+    async def _send_batch(self) -> None:
+        batch = list(islice(self._pending.items(), self.batch_size))
+        events = [payload for _, (_, _, payload) in batch]
+        body = events[0] if self.batch_size == 1 else {"events": events}
+        async with self.http.request(
+            "n8n_voice_state", "POST", self.url, json=body, timeout=self.http.timeout_for("n8n_voice_state", self.timeout)
+        ) as response:
+            status = response.status
+            if 400 <= status < 500 and status not in (408, 429):
+                self.rejected += len(batch)
+                self.last_error = f"HTTP {status}"
+                log.warning(
+                    "Voice-state outbox: n8n rejected %s states with HTTP %s, dropping them (guilds %s)",
+                    len(batch),
+                    status,
+                    ", ".join(str(guild_id) for guild_id, _ in batch),
+                )
+            elif status < 200 or status >= 300:
+                raise RuntimeError(f"HTTP {status}")
+            else:
+                self.sent += len(batch)
+
+        done = [(guild_id, seq) for guild_id, (seq, _, _) in batch]
+        for guild_id, seq in done:
+            current = self._pending.get(guild_id)
+            if current is not None and current[0] == seq:
+                del self._pending[guild_id]
+        await self.db.run(_delete_sent, done)
+
+    def summary(self) -> str:
+        return (
+            f"backlog={self.backlog} oldest={self.oldest_age():.0f}s sent={self.sent} "
+            f"coalesced={self.coalesced} failures={self.failures} rejected={self.rejected}"
+            + (f" last_error={self.last_error}" if self.last_error else "")
+        )